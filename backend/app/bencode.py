@@ -1,111 +1,122 @@
-""
+"""
 Bencode encoding and decoding for BitTorrent protocol.
 """
-import io
-import json
-from typing import Any, Dict, List, Union, BinaryIO
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 class BencodeDecodeError(ValueError):
     """Exception raised for errors in bencode decoding."""
     pass
 
-def decode_int(stream: BinaryIO) -> int:
+# Canonical integer: optional '-', no leading zeros, no "-0"; int() alone
+# would also take spaces, '+' and '_'
+_INT_RE = re.compile(rb"-?[1-9][0-9]*|0")
+
+def decode_int(buf: bytes, pos: int) -> Tuple[int, int]:
     """
-    Decode a bencoded integer from the stream.
+    Decode a bencoded integer starting just after the leading 'i'.
     
     Format: i<number>e
     Example: i42e -> 42
-    """
-    result = 0
-    sign = 1
-    char = stream.read(1)
-    
-    if char == b"-":
-        sign = -1
-        char = stream.read(1)
-    
-    while char.isdigit():
-        result = result * 10 + int(char)
-        char = stream.read(1)
     
-    if char != b"e":
+    Returns:
+        The decoded integer and the position just past the trailing 'e'
+    """
+    try:
+        end = buf.index(b"e", pos)
+    except ValueError:
         raise BencodeDecodeError("Expected 'e' at end of integer")
     
-    return sign * result
+    digits = buf[pos:end]
+    if not _INT_RE.fullmatch(digits):
+        raise BencodeDecodeError(f"Invalid integer: {digits!r}")
+    return int(digits), end + 1
 
-def decode_string(stream: BinaryIO) -> bytes:
+def decode_string(buf: bytes, pos: int) -> Tuple[bytes, int]:
     """
-    Decode a bencoded string from the stream.
+    Decode a bencoded string starting at its length prefix.
     
     Format: <length>:<data>
     Example: 5:hello -> b'hello'
+    
+    Returns:
+        The decoded bytes and the position just past the data
     """
-    length_str = b""
-    char = stream.read(1)
+    try:
+        colon = buf.index(b":", pos)
+    except ValueError:
+        raise BencodeDecodeError("Expected ':' after string length")
     
-    while char.isdigit():
-        length_str += char
-        char = stream.read(1)
+    length_str = buf[pos:colon]
+    if not length_str.isdigit():
+        raise BencodeDecodeError(f"Invalid string length: {length_str!r}")
     
-    if char != b":":
-        raise BencodeDecodeError("Expected ':' after string length")
+    start = colon + 1
+    end = start + int(length_str)
+    if end > len(buf):
+        raise BencodeDecodeError("String data exceeds input length")
+    return buf[start:end], end
+
+def _decode(buf: bytes, pos: int) -> Tuple[Any, int]:
+    """
+    Decode the bencoded value at ``pos``.
     
-    length = int(length_str)
-    return stream.read(length)
+    Returns:
+        The decoded value and the position just past it
+    """
+    try:
+        char = buf[pos]
+    except IndexError:
+        raise BencodeDecodeError("Unexpected end of data")
+    
+    # Strings dominate .torrent files and tracker replies, so test them first
+    if 0x30 <= char <= 0x39:  # '0'-'9'
+        return decode_string(buf, pos)
+    elif char == 0x69:  # 'i'
+        return decode_int(buf, pos + 1)
+    elif char == 0x6C:  # 'l'
+        result = []
+        pos += 1
+        while buf[pos:pos + 1] != b"e":
+            value, pos = _decode(buf, pos)
+            result.append(value)
+        return result, pos + 1
+    elif char == 0x64:  # 'd'
+        result = {}
+        pos += 1
+        while buf[pos:pos + 1] != b"e":
+            key, pos = _decode_key(buf, pos)
+            result[key], pos = _decode(buf, pos)
+        return result, pos + 1
+    else:
+        raise BencodeDecodeError(f"Unexpected token: {bytes([char])!r}")
 
-def decode(stream: Union[BinaryIO, bytes, str]) -> Any:
+def decode(data: Union[bytes, str]) -> Any:
     """
-    Decode a bencoded value from the stream or bytes.
+    Decode a bencoded value from bytes.
     
     Args:
-        stream: A file-like object or bytes containing bencoded data
+        data: Bytes or str containing bencoded data
         
     Returns:
         The decoded Python object (int, bytes, list, or dict)
     """
-    if isinstance(stream, (bytes, str)):
-        if isinstance(stream, str):
-            stream = stream.encode('utf-8')
-        stream = io.BytesIO(stream)
-    
-    char = stream.read(1)
-    
-    if char == b"i":
-        return decode_int(stream)
-    elif char.isdigit():
-        stream.seek(-1, 1)  # Go back one byte
-        return decode_string(stream)
-    elif char == b"l":
-        return _decode_list(stream)
-    elif char == b"d":
-        return _decode_dict(stream)
-    elif char == b"e":
-        return None
-    else:
-        raise BencodeDecodeError(f"Unexpected token: {char}")
-
-def _decode_list(stream: BinaryIO) -> List[Any]:
-    """Decode a bencoded list."""
-    result = []
-    while True:
-        value = decode(stream)
-        if value is None:  # Reached end of list
-            break
-        result.append(value)
-    return result
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    elif not isinstance(data, bytes):
+        data = bytes(data)
+    
+    value, _ = _decode(data, 0)
+    return value
 
-def _decode_dict(stream: BinaryIO) -> Dict[bytes, Any]:
-    """Decode a bencoded dictionary."""
-    result = {}
-    while True:
-        key = decode(stream)
-        if key is None:  # Reached end of dict
-            break
-        if not isinstance(key, bytes):
-            raise BencodeDecodeError("Dictionary keys must be strings")
-        value = decode(stream)
-        result[key] = value
-    return result
+def _decode_key(buf: bytes, pos: int) -> Tuple[bytes, int]:
+    """Decode a dictionary key, which must be a bencoded string."""
+    if pos >= len(buf):
+        raise BencodeDecodeError("Unexpected end of data")
+    if not 0x30 <= buf[pos] <= 0x39:
+        raise BencodeDecodeError("Dictionary keys must be strings")
+    return decode_string(buf, pos)
 
 def encode(obj: Any) -> bytes:
     """
@@ -117,26 +128,272 @@ def encode(obj: Any) -> bytes:
     Returns:
         The bencoded data as bytes
     """
+    out = bytearray()
+    _encode(obj, out)
+    return bytes(out)
+
+def _encode(obj: Any, out: bytearray) -> None:
+    """Append the bencoded form of ``obj`` to ``out``."""
     if isinstance(obj, int):
-        return f"i{obj}e".encode()
+        out += b"i%de" % obj
     elif isinstance(obj, (str, bytes)):
         if isinstance(obj, str):
             obj = obj.encode('utf-8')
-        return f"{len(obj)}:".encode() + obj
+        out += b"%d:" % len(obj)
+        out += obj
     elif isinstance(obj, list):
-        return b"l" + b"".join(encode(item) for item in obj) + b"e"
+        out += b"l"
+        for item in obj:
+            _encode(item, out)
+        out += b"e"
     elif isinstance(obj, dict):
-        result = [b"d"]
-        for k, v in sorted(obj.items()):
-            if not isinstance(k, (str, bytes)):
+        items = []
+        for k, v in obj.items():
+            if isinstance(k, str):
+                k = k.encode('utf-8')
+            elif not isinstance(k, bytes):
                 raise ValueError("Dictionary keys must be strings")
-            result.append(encode(k))
-            result.append(encode(v))
-        result.append(b"e")
-        return b"".join(result)
+            items.append((k, v))
+        # Keys must be sorted as raw byte strings
+        items.sort(key=lambda kv: kv[0])
+        out += b"d"
+        for k, v in items:
+            out += b"%d:" % len(k)
+            out += k
+            _encode(v, out)
+        out += b"e"
     else:
         raise ValueError(f"Unsupported type: {type(obj)}")
 
+def bdecode_with_info_span(data: bytes) -> Tuple[Any, Optional[Tuple[int, int]]]:
+    """
+    Decode a .torrent file, also locating the raw bytes of its 'info' value.
+    
+    Args:
+        data: The bencoded .torrent file contents
+        
+    Returns:
+        The decoded object and the (start, end) byte range of the top-level
+        'info' value, or None if there is no such key
+    """
+    data = bytes(data)
+    if data[:1] != b"d":
+        return decode(data), None
+    
+    result = {}
+    info_span = None
+    pos = 1
+    while data[pos:pos + 1] != b"e":
+        key, pos = _decode_key(data, pos)
+        start = pos
+        value, pos = _decode(data, pos)
+        if key == b"info":
+            info_span = (start, pos)
+        result[key] = value
+    return result, info_span
+
+def _skip(buf: bytes, pos: int) -> int:
+    """Return the position just past the bencoded value at ``pos`` without decoding it."""
+    try:
+        char = buf[pos]
+        if 0x30 <= char <= 0x39:  # '0'-'9'
+            colon = buf.index(b":", pos)
+            length_str = buf[pos:colon]
+            if not length_str.isdigit():
+                raise BencodeDecodeError(f"Invalid string length: {length_str!r}")
+            end = colon + 1 + int(length_str)
+        elif char == 0x69:  # 'i'
+            end = decode_int(buf, pos + 1)[1]
+        elif char == 0x6C or char == 0x64:  # 'l' or 'd'
+            pos += 1
+            while buf[pos] != 0x65:  # 'e'
+                pos = _skip(buf, pos)
+            end = pos + 1
+        else:
+            raise BencodeDecodeError(f"Unexpected token: {bytes([char])!r}")
+    except BencodeDecodeError:
+        raise
+    except (IndexError, ValueError):
+        raise BencodeDecodeError(f"Malformed data at position {pos}")
+    
+    if end > len(buf):
+        raise BencodeDecodeError("String data exceeds input length")
+    return end
+
+def find_info_span(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Locate the raw bytes of the top-level 'info' value without decoding it.
+    
+    Args:
+        data: The bencoded .torrent file contents
+        
+    Returns:
+        The (start, end) byte range of the 'info' value, or None if the data
+        is not a dictionary or has no such key
+    """
+    if data[:1] != b"d":
+        return None
+    
+    pos = 1
+    while data[pos:pos + 1] != b"e":
+        key, pos = _decode_key(data, pos)
+        end = _skip(data, pos)
+        if key == b"info":
+            return pos, end
+        pos = end
+    return None
+
+class IncrementalInfoHasher:
+    """
+    Compute a torrent's info_hash from its bytes fed in arbitrary chunks.
+    
+    Tracks just enough bencode structure to find where the top-level 'info'
+    value starts and ends, and feeds those bytes to SHA-1 as they arrive.
+    String data is skipped by length, so large 'pieces' strings cost nothing
+    beyond the hash itself.
+    """
+    
+    _VALUE, _INT, _STRLEN, _STRDATA = range(4)
+    
+    def __init__(self):
+        self._sha1 = hashlib.sha1()
+        self._mode = self._VALUE
+        # One entry per open container: [is_dict, next_item_is_key]
+        self._stack: List[List[bool]] = []
+        self._digits = bytearray()
+        self._remaining = 0
+        self._key: Optional[bytearray] = None  # Top-level key being read
+        self._last_key = b""
+        self._hashing = False
+        self._found = False  # Set once the whole 'info' value has been hashed
+        self._done = False
+    
+    def feed(self, chunk: bytes) -> None:
+        """Process the next chunk of the .torrent file."""
+        chunk = bytes(chunk)
+        pos = 0
+        end = len(chunk)
+        hash_from = 0
+        
+        while pos < end and not self._done:
+            mode = self._mode
+            if mode == self._STRDATA:
+                take = min(self._remaining, end - pos)
+                if self._key is not None:
+                    self._key += chunk[pos:pos + take]
+                pos += take
+                self._remaining -= take
+                if not self._remaining:
+                    self._end_value()
+            elif mode == self._STRLEN:
+                colon = chunk.find(b":", pos)
+                if colon < 0:
+                    self._digits += chunk[pos:]
+                    pos = end
+                    continue
+                self._digits += chunk[pos:colon]
+                if not self._digits.isdigit():
+                    raise BencodeDecodeError(f"Invalid string length: {bytes(self._digits)!r}")
+                self._remaining = int(self._digits)
+                pos = colon + 1
+                self._mode = self._STRDATA
+                if not self._remaining:
+                    self._end_value()
+            elif mode == self._INT:
+                e = chunk.find(b"e", pos)
+                if e < 0:
+                    self._digits += chunk[pos:]
+                    pos = end
+                    continue
+                self._digits += chunk[pos:e]
+                if not _INT_RE.fullmatch(self._digits):
+                    raise BencodeDecodeError(f"Invalid integer: {bytes(self._digits)!r}")
+                pos = e + 1
+                self._end_value()
+            else:
+                char = chunk[pos]
+                if char == 0x65:  # 'e'
+                    if not self._stack:
+                        raise BencodeDecodeError("Unexpected token: b'e'")
+                    self._stack.pop()
+                    pos += 1
+                    self._end_value()
+                else:
+                    top = self._stack[-1] if self._stack else None
+                    if (len(self._stack) == 1 and top[0] and not top[1]
+                            and self._last_key == b"info"):
+                        self._hashing = True
+                        hash_from = pos
+                    pos += 1
+                    if 0x30 <= char <= 0x39:  # '0'-'9'
+                        self._mode = self._STRLEN
+                        self._digits = bytearray([char])
+                        if len(self._stack) == 1 and top[0] and top[1]:
+                            self._key = bytearray()
+                    elif char == 0x69:  # 'i'
+                        self._mode = self._INT
+                        self._digits = bytearray()
+                    elif char == 0x6C or char == 0x64:  # 'l' or 'd'
+                        self._stack.append([char == 0x64, True])
+                    else:
+                        raise BencodeDecodeError(f"Unexpected token: {bytes([char])!r}")
+            
+            if self._hashing and self._done:
+                self._sha1.update(chunk[hash_from:pos])
+                self._hashing = False
+        
+        if self._hashing:
+            self._sha1.update(chunk[hash_from:])
+    
+    def _end_value(self) -> None:
+        """Update container state after a complete value."""
+        self._mode = self._VALUE
+        if not self._stack:
+            self._done = True  # Top-level value finished
+            return
+        top = self._stack[-1]
+        if top[0]:
+            if top[1] and self._key is not None:
+                self._last_key = bytes(self._key)
+                self._key = None
+            top[1] = not top[1]
+        if self._hashing and len(self._stack) == 1:
+            self._found = self._done = True  # The 'info' value just ended
+    
+    def hexdigest(self) -> Optional[str]:
+        """Return the hex info_hash, or None if no complete 'info' value was seen."""
+        if not self._found:
+            return None
+        return self._sha1.hexdigest()
+
+def bdecode_keys(data: bytes, keys: Tuple[bytes, ...]) -> Dict[bytes, Any]:
+    """
+    Decode only the given keys of a top-level bencoded dictionary.
+    
+    Values under any other key are skipped without being decoded, and
+    parsing stops as soon as every requested key has been seen.
+    
+    Args:
+        data: The bencoded dictionary
+        keys: The keys to decode
+        
+    Returns:
+        A dict holding whichever of the requested keys were present
+    """
+    data = bytes(data)
+    if data[:1] != b"d":
+        raise BencodeDecodeError("Expected a dictionary")
+    
+    result = {}
+    pos = 1
+    while data[pos:pos + 1] != b"e" and len(result) < len(keys):
+        key, pos = _decode_key(data, pos)
+        if key in keys:
+            result[key], pos = _decode(data, pos)
+        else:
+            pos = _skip(data, pos)
+    return result
+
 def bdecode(data: Union[bytes, str]) -> Any:
     """Decode bencoded data."""
     return decode(data)
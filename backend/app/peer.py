@@ -4,41 +4,143 @@ Handles peer connections and message protocol.
 """
 import asyncio
 import hashlib
+import heapq
 import logging
+import os
 import struct
-from dataclasses import dataclass
+import threading
+import time
+from collections import defaultdict
 from typing import Optional, Dict, List, Tuple, Set
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@dataclass
-class BlockRequest:
-    """Represents a requested block of data from a piece."""
-    piece_index: int
-    offset: int
-    length: int = 2**14  # Default block size: 16KB
+# Precompiled wire formats (big-endian, as per the BitTorrent spec)
+_MSG_HDR = struct.Struct("!IB")  # length prefix + message id
+_PIECE_HDR = struct.Struct("!II")  # piece index + block offset
+_HAVE = struct.Struct("!I")  # piece index
+_REQUEST = struct.Struct("!IBIII")
+_INTERESTED = struct.Struct("!IB").pack(1, 2)
+
+# Protocol string length + protocol string + 8 reserved bytes
+_HS_PREFIX = bytes([19]) + b"BitTorrent protocol" + bytes(8)
+
+BLOCK_SIZE = 2**14  # 16KB, the block size all clients accept
+
+# Block requests kept in flight per peer. Like TCP's congestion window, it
+# starts small, grows by one per block received (doubling each round trip)
+# up to the slow-start threshold and by one per round trip after that, and
+# is halved when a request is lost (choke, error or timeout)
+MIN_PIPELINE_DEPTH = 4
+MAX_PIPELINE_DEPTH = 128
+
+# Seconds to wait for the next message while blocks are outstanding
+BLOCK_TIMEOUT = 30
+
+# Seconds allowed for a peer's TCP connect plus handshake
+CONNECT_TIMEOUT = 5
+# Seconds to wait for the 'bitfield' that follows the handshake; peers
+# with no pieces may send none
+BITFIELD_TIMEOUT = 1
+
+# Response latency tracking: exponential moving average weight for new
+# samples, starting estimate for unmeasured peers, and the sample recorded
+# when a request fails outright
+LATENCY_EMA_ALPHA = 0.125
+INITIAL_LATENCY_MS = 1000.0
+FAILED_REQUEST_LATENCY_MS = 10000.0
 
 class PeerConnection:
     """Handles communication with a single peer."""
     
-    def __init__(self, ip: str, port: int, peer_id: bytes, info_hash: bytes):
+    def __init__(self, ip: str, port: int, peer_id: bytes, info_hash: bytes,
+                 num_pieces: int):
         self.ip = ip
         self.port = port
         self.peer_id = peer_id
         self.info_hash = info_hash
         self.reader = None
         self.writer = None
-        self.bitfield = None
+        self.num_pieces = num_pieces
+        # One bit per piece, high bit of byte 0 is piece 0 (wire layout)
+        self.bitfield = bytearray((num_pieces + 7) // 8)
         self.am_choking = True
         self.am_interested = False
         self.peer_choking = True
         self.peer_interested = False
         self.connected = False
-        self.pieces_have = set()
         self.download_speed = 0
+        # Request window and slow-start threshold (see MIN_PIPELINE_DEPTH)
+        self._window = float(MIN_PIPELINE_DEPTH)
+        self._ssthresh = float(MAX_PIPELINE_DEPTH)
         self.upload_speed = 0
+        self.latency_ms = INITIAL_LATENCY_MS
+        # Called as on_have(peer, piece_index) for 'have' messages; set by
+        # PeerManager to keep its piece index current
+        self.on_have = None
+        # Held across each request/response exchange; concurrent batches
+        # would otherwise interleave reads on the same stream
+        self._io_lock = asyncio.Lock()
+
+    def record_latency(self, sample_ms: float) -> None:
+        """Fold a request/response time into the smoothed latency estimate."""
+        self.latency_ms += LATENCY_EMA_ALPHA * (sample_ms - self.latency_ms)
+
+    @property
+    def pipeline_depth(self) -> int:
+        """Number of block requests to keep outstanding with this peer."""
+        return int(self._window)
+
+    def _block_received(self) -> None:
+        """Grow the request window after a block arrives."""
+        if self._window < self._ssthresh:
+            self._window += 1  # slow start
+        else:
+            self._window += 1 / self._window  # additive increase
+        self._window = min(self._window, MAX_PIPELINE_DEPTH)
+
+    def _request_lost(self) -> None:
+        """Halve the request window after a choke, error or timeout."""
+        self._ssthresh = max(MIN_PIPELINE_DEPTH, self._window / 2)
+        self._window = self._ssthresh
+
+    @property
+    def alive(self) -> bool:
+        """Whether the connection is still usable (not closed by either side)."""
+        return (self.connected and self.writer is not None and
+                not self.writer.is_closing() and not self.reader.at_eof())
+
+    def has_piece(self, piece_index: int) -> bool:
+        """Check whether the peer has announced the given piece."""
+        byte_index = piece_index >> 3
+        return (byte_index < len(self.bitfield) and
+                bool(self.bitfield[byte_index] & (0x80 >> (piece_index & 7))))
+
+    def set_piece(self, piece_index: int) -> None:
+        """Mark the given piece as available from the peer (ignored if out of range)."""
+        # The index comes off the wire; never let it grow the bitfield
+        if not 0 <= piece_index < self.num_pieces:
+            return
+        self.bitfield[piece_index >> 3] |= 0x80 >> (piece_index & 7)
+
+    def set_bitfield(self, payload: bytes) -> None:
+        """Replace the piece bitfield with a 'bitfield' message payload."""
+        # Drop any bytes and spare bits past the last piece
+        self.bitfield = bytearray(payload[:(self.num_pieces + 7) // 8])
+        spare = -self.num_pieces % 8
+        if spare and self.bitfield:
+            self.bitfield[-1] &= (0xFF << spare) & 0xFF
+
+    def iter_pieces(self):
+        """Yield the indices of all pieces the peer has."""
+        for byte_index, byte in enumerate(self.bitfield):
+            if byte:
+                base = byte_index * 8
+                for bit in range(8):
+                    if byte & (0x80 >> bit):
+                        yield base + bit
 
     async def connect(self) -> bool:
         """Establish connection to the peer."""
@@ -58,21 +160,14 @@ class PeerConnection:
             return False
 
         try:
-            handshake = (
-                struct.pack("!B", 19) +  # Protocol string length
-                b"BitTorrent protocol" +  # Protocol string
-                bytes(8) +                # 8 reserved bytes
-                self.info_hash +          # Info hash
-                self.peer_id              # Our peer ID
-            )
-            
-            self.writer.write(handshake)
+            # Queue the fixed prefix and per-torrent fields as one write
+            self.writer.writelines((_HS_PREFIX, self.info_hash, self.peer_id))
             await self.writer.drain()
 
             response = await self.reader.readexactly(68)
             
-            if (len(response) == 68 and 
-                response[1:20] == b"BitTorrent protocol" and
+            # Reserved bytes are extension flags and may differ per peer
+            if (response[:20] == _HS_PREFIX[:20] and
                 response[28:48] == self.info_hash):
                 logger.info(f"Handshake successful with {self.ip}:{self.port}")
                 return True
@@ -82,47 +177,167 @@ class PeerConnection:
             
         return False
 
+    async def read_bitfield(self, timeout: float = BITFIELD_TIMEOUT) -> None:
+        """
+        Read the message a peer sends right after the handshake.
+        
+        This is normally its 'bitfield'. Peers with nothing to offer may send
+        nothing at all, in which case this gives up after the timeout.
+        
+        Args:
+            timeout: Seconds allowed for the whole message to arrive
+            
+        Raises:
+            ValueError: If the message is too long for a bitfield or 'have'
+            asyncio.TimeoutError: If the peer stalled partway through a message
+        """
+        max_length = max((self.num_pieces + 7) // 8, 4) + 1
+        header = None
+
+        async def read_message() -> bytes:
+            nonlocal header
+            header = await self._read_message_header()
+            if header[0] > max_length:
+                raise ValueError(f"{header[0]}-byte message from {self.ip}:{self.port}")
+            return await self.reader.readexactly(header[0] - 1)
+
+        try:
+            payload = await asyncio.wait_for(read_message(), timeout)
+        except asyncio.TimeoutError:
+            if header is not None:
+                raise  # stalled mid-message: the stream is out of sync
+            # readexactly leaves the buffer untouched if it is cancelled
+            return
+        message_id = header[1]
+        if message_id == 5:  # bitfield
+            self.set_bitfield(payload)
+        elif message_id == 4:  # have
+            self.set_piece(_HAVE.unpack(payload)[0])
+        elif message_id in (0, 1):  # choke / unchoke
+            self.peer_choking = message_id == 0
+
     async def send_interested(self) -> None:
         """Send interested message to peer."""
         if self.connected and self.writer:
-            self.writer.write(struct.pack("!IB", 1, 2))
+            self.writer.write(_INTERESTED)
             await self.writer.drain()
             self.am_interested = True
 
-    async def request_piece(self, piece_index: int, block: BlockRequest) -> Optional[bytes]:
-        """Request a block of data from a piece."""
-        if not self.connected or not self.writer:
-            return None
-
-        try:
-            message = struct.pack(
-                "!IBIII", 
-                13,  # message length
-                6,   # request id
-                piece_index,
-                block.offset,
-                block.length
-            )
+    async def download_piece(self, piece_index: int, piece_length: int) -> Optional[bytearray]:
+        """
+        Download a whole piece, keeping several block requests in flight.
+        
+        Args:
+            piece_index: Index of the piece to download
+            piece_length: Size of the piece in bytes
             
-            self.writer.write(message)
-            await self.writer.drain()
-            
-            length = struct.unpack("!I", await self.reader.readexactly(4))[0]
-            if length == 0:
+        Returns:
+            The piece data (the buffer the blocks were read into, not a copy),
+            or None if the peer choked us or the transfer failed (in which
+            case the connection is closed, as the stream may be out of sync)
+        """
+        async with self._io_lock:
+            if not self.alive:
                 return None
+            return await self._download_piece(piece_index, piece_length)
+
+    async def _download_piece(self, piece_index: int, piece_length: int) -> Optional[bytearray]:
+        """download_piece, with the connection's I/O lock held."""
+        # A block, or a bitfield should the peer resend one
+        max_length = max(_PIECE_HDR.size + BLOCK_SIZE, (self.num_pieces + 7) // 8) + 1
+        offsets = range(0, piece_length, BLOCK_SIZE)
+        piece = bytearray(piece_length)
+        outstanding = set()
+        next_block = 0
+        started = time.monotonic()
+        first_block = True
+        
+        try:
+            while next_block < len(offsets) or outstanding:
+                # Top the pipeline back up before waiting for the next block
+                depth = self.pipeline_depth
+                while next_block < len(offsets) and len(outstanding) < depth:
+                    offset = offsets[next_block]
+                    self.writer.write(_REQUEST.pack(
+                        13, 6, piece_index, offset,
+                        min(BLOCK_SIZE, piece_length - offset)))
+                    outstanding.add(offset)
+                    next_block += 1
+                await self.writer.drain()
                 
-            message_id = struct.unpack("!B", await self.reader.readexactly(1))[0]
-            
-            if message_id == 7:  # piece message
-                piece = struct.unpack("!I", await self.reader.readexactly(4))[0]
-                offset = struct.unpack("!I", await self.reader.readexactly(4))[0]
-                data = await self.reader.readexactly(length - 9)
-                return data
-                
+                # The whole message, so a peer stalling mid-block times out too
+                message_id, payload = await asyncio.wait_for(
+                    self._read_message(max_length), BLOCK_TIMEOUT)
+                if message_id == 7:  # piece
+                    index, offset = _PIECE_HDR.unpack_from(payload)
+                    if index == piece_index and offset in outstanding:
+                        size = len(payload) - _PIECE_HDR.size
+                        if size != min(BLOCK_SIZE, piece_length - offset):
+                            raise ValueError(f"{size}-byte block at offset {offset}")
+                        if first_block:
+                            # Time to the first block approximates one round trip
+                            self.record_latency((time.monotonic() - started) * 1000)
+                            first_block = False
+                        piece[offset:offset + size] = memoryview(payload)[_PIECE_HDR.size:]
+                        outstanding.discard(offset)
+                        self._block_received()
+                elif message_id == 0:  # choke: pending requests are dropped
+                    self.peer_choking = True
+                    self._request_lost()
+                    return None
+                elif message_id == 4:  # have
+                    have_index = _HAVE.unpack(payload)[0]
+                    if self.on_have is not None:
+                        self.on_have(self, have_index)
+                    else:
+                        self.set_piece(have_index)
+                        
+        except asyncio.CancelledError:
+            # e.g. run_on_peer_loop timed out: requests are still outstanding,
+            # so the next exchange would read their stale blocks
+            self.connected = False
+            self.writer.close()
+            raise
         except Exception as e:
-            logger.error(f"Error requesting piece {piece_index}: {e}")
+            logger.error(f"Error downloading piece {piece_index} from {self.ip}:{self.port}: {e!r}")
+            self.record_latency(FAILED_REQUEST_LATENCY_MS)
+            self._request_lost()
+            self.connected = False
+            self.writer.close()
+            return None
+        
+        elapsed = time.monotonic() - started
+        if elapsed > 0:
+            self.download_speed = piece_length / elapsed
+        return piece
+
+    async def _read_message_header(self) -> Tuple[int, int]:
+        """Read the next message's length prefix and id, skipping keep-alives."""
+        header = await self.reader.readexactly(_MSG_HDR.size)
+        length, message_id = _MSG_HDR.unpack(header)
+        while length == 0:
+            # Keep-alive: the byte read as the id starts the next prefix
+            header = header[4:] + await self.reader.readexactly(4)
+            length, message_id = _MSG_HDR.unpack(header)
+        return length, message_id
+
+    async def _read_message(self, max_length: int) -> Tuple[int, bytes]:
+        """
+        Read the next whole message, skipping keep-alives.
+        
+        Args:
+            max_length: Largest length prefix to accept
+            
+        Returns:
+            (message id, payload)
             
-        return None
+        Raises:
+            ValueError: If the length prefix exceeds max_length
+        """
+        length, message_id = await self._read_message_header()
+        if length > max_length:
+            raise ValueError(f"{length}-byte message from {self.ip}:{self.port}")
+        return message_id, await self.reader.readexactly(length - 1)
 
     async def close(self) -> None:
         """Close the connection."""
@@ -133,37 +348,264 @@ class PeerConnection:
             logger.info(f"Closed connection to {self.ip}:{self.port}")
 
 class PeerManager:
-    """Manages multiple peer connections."""
+    """
+    Manages multiple peer connections.
     
-    def __init__(self, info_hash: bytes, peer_id: bytes):
+    Create it on the event loop that runs its coroutines: before Python
+    3.10 its asyncio primitives bind to the loop current at construction.
+    """
+    
+    def __init__(self, info_hash: bytes, peer_id: bytes, num_pieces: int,
+                 max_connections: int = 50,
+                 connect_timeout: float = CONNECT_TIMEOUT):
         self.info_hash = info_hash
         self.peer_id = peer_id
+        self.num_pieces = num_pieces
         self.peers = {}
         self.lock = asyncio.Lock()
+        # Bounds the number of connects/handshakes in flight at once
+        self._connect_sem = asyncio.Semaphore(max_connections)
+        # So a few unresponsive peers can't hold up a whole add_peers batch
+        self.connect_timeout = connect_timeout
+        # Inverted index of piece index -> peers known to have it
+        self._piece_to_peers: Dict[int, Set[PeerConnection]] = defaultdict(set)
+        # Pieces we have verified locally, in the same layout as a peer bitfield
+        self.bitfield = bytearray((num_pieces + 7) // 8)
+        # File descriptor mirroring self.bitfield, if resume data is enabled
+        self._resume_fd: Optional[int] = None
+        # Pieces are marked from request threads; guards the bitfield's
+        # read-modify-write and the resume file
+        self._bitfield_lock = threading.Lock()
+        # "ip:port" for each connected peer, rebuilt only after the set changes
+        self._peer_labels: Optional[List[str]] = None
+        # The labels are read from request threads, so the peer loop holds
+        # this while changing self.peers
+        self._peers_lock = threading.Lock()
 
     async def add_peer(self, ip: str, port: int):
-        """Add and connect to a new peer."""
-        if (ip, port) in self.peers:
-            return self.peers[(ip, port)]
+        """Add and connect to a new peer (or reconnect one whose connection closed)."""
+        existing = self.peers.get((ip, port))
+        if existing is not None:
+            if existing.alive:
+                return existing
+            self.remove_peer(existing)
+            existing.writer.close()
 
-        peer = PeerConnection(ip, port, self.peer_id, self.info_hash)
-        if await peer.connect() and await peer.perform_handshake():
-            async with self.lock:
+        peer = PeerConnection(ip, port, self.peer_id, self.info_hash,
+                              self.num_pieces)
+        async with self._connect_sem:
+            try:
+                ok = await asyncio.wait_for(self._open(peer), self.connect_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Timed out connecting to {ip}:{port}")
+                ok = False
+            if not ok:
+                if peer.writer is not None:
+                    peer.writer.close()
+                return None
+        try:
+            await peer.read_bitfield()
+        except asyncio.CancelledError:
+            peer.writer.close()
+            raise
+        except Exception as e:
+            logger.error(f"Failed to read bitfield from {ip}:{port}: {e!r}")
+            peer.writer.close()
+            return None
+        peer.on_have = self.register_have
+        async with self.lock:
+            # Re-check now that the handshake is done; the check and the
+            # insert below have no await between them
+            current = self.peers.get((ip, port))
+            if current is not None and current.alive:
+                # A concurrent add_peer for this address connected first
+                peer.writer.close()
+                return current
+            if current is not None:
+                self.remove_peer(current)
+                current.writer.close()
+            with self._peers_lock:
                 self.peers[(ip, port)] = peer
-            return peer
-        return None
+                self._peer_labels = None
+            self.register_bitfield(peer)
+        return peer
 
-    async def get_peer_for_piece(self, piece_index: int):
-        """Get a peer that has the specified piece."""
-        async with self.lock:
-            for peer in self.peers.values():
-                if piece_index in peer.pieces_have:
-                    return peer
-        return None
+    @staticmethod
+    async def _open(peer: PeerConnection) -> bool:
+        """Connect to a peer and perform the handshake."""
+        return await peer.connect() and await peer.perform_handshake()
+
+    async def add_peers(self, addresses: List[Tuple[str, int]]) -> List[Optional[PeerConnection]]:
+        """
+        Connect to several peers concurrently.
+        
+        Args:
+            addresses: (ip, port) pairs to connect to
+            
+        Returns:
+            The PeerConnection (or None, or the raised exception) for each
+            address, in the same order
+        """
+        return await asyncio.gather(
+            *(self.add_peer(ip, port) for ip, port in addresses),
+            return_exceptions=True
+        )
+
+    @property
+    def peer_labels(self) -> List[str]:
+        """Connected peers as "ip:port" strings (cached; do not mutate)."""
+        with self._peers_lock:
+            if self._peer_labels is None:
+                self._peer_labels = [f"{ip}:{port}" for ip, port in self.peers]
+            return self._peer_labels
+
+    def register_have(self, peer: PeerConnection, piece_index: int) -> None:
+        """Record that a peer has announced a piece via a 'have' message."""
+        if not 0 <= piece_index < self.num_pieces:
+            return
+        peer.set_piece(piece_index)
+        self._piece_to_peers[piece_index].add(peer)
+
+    def register_bitfield(self, peer: PeerConnection, bitfield: Optional[bytes] = None) -> None:
+        """
+        Index the pieces a peer announced via a 'bitfield' message.
+        
+        Args:
+            peer: The peer
+            bitfield: New bitfield payload; if None, the peer's current
+                bitfield is indexed as is
+        """
+        if bitfield is not None:
+            for piece_index in peer.iter_pieces():
+                self._piece_to_peers[piece_index].discard(peer)
+            peer.set_bitfield(bitfield)
+        for piece_index in peer.iter_pieces():
+            self._piece_to_peers[piece_index].add(peer)
+
+    def remove_peer(self, peer: PeerConnection) -> None:
+        """Forget a peer and the pieces it announced (e.g. after it disconnects)."""
+        with self._peers_lock:
+            self.peers.pop((peer.ip, peer.port), None)
+            self._peer_labels = None
+        for piece_index in peer.iter_pieces():
+            peers = self._piece_to_peers.get(piece_index)
+            if peers is not None:
+                peers.discard(peer)
+                if not peers:
+                    del self._piece_to_peers[piece_index]
+
+    def load_resume_bitfield(self, path: str) -> None:
+        """
+        Seed the local bitfield from a resume file and keep the file updated.
+        
+        Args:
+            path: File holding the bitfield of verified pieces; created if missing
+        """
+        self.close_resume_bitfield()
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        with self._bitfield_lock:
+            self._resume_fd = fd
+            saved = os.read(fd, len(self.bitfield))
+            self.bitfield[:len(saved)] = saved
+        logger.info(f"Loaded resume bitfield from {path}")
+
+    def close_resume_bitfield(self) -> None:
+        """Stop mirroring the local bitfield to its resume file."""
+        with self._bitfield_lock:
+            if self._resume_fd is not None:
+                os.close(self._resume_fd)
+                self._resume_fd = None
+
+    def mark_have(self, piece_index: int) -> None:
+        """Record that a piece has been downloaded and verified locally."""
+        byte_index = piece_index >> 3
+        with self._bitfield_lock:
+            self.bitfield[byte_index] |= 0x80 >> (piece_index & 7)
+            if self._resume_fd is not None:
+                # Only the changed byte is rewritten
+                byte = self.bitfield[byte_index:byte_index + 1]
+                if hasattr(os, 'pwrite'):
+                    os.pwrite(self._resume_fd, byte, byte_index)
+                else:
+                    # No pwrite on Windows; the lock keeps seek+write together
+                    os.lseek(self._resume_fd, byte_index, os.SEEK_SET)
+                    os.write(self._resume_fd, byte)
+
+    def has_piece(self, piece_index: int) -> bool:
+        """Check whether a piece has been downloaded and verified locally."""
+        byte_index = piece_index >> 3
+        return (byte_index < len(self.bitfield) and
+                bool(self.bitfield[byte_index] & (0x80 >> (piece_index & 7))))
+
+    def availability(self, piece_index: int) -> int:
+        """Number of connected peers known to have a piece (for rarest-first)."""
+        peers = self._piece_to_peers.get(piece_index)
+        return len(peers) if peers else 0
+
+    async def rarest_pieces(self, count: int) -> List[int]:
+        """
+        Pick pieces to download next, rarest first.
+        
+        A coroutine so that it runs on the peer loop, which owns the piece
+        index; 'have' messages arriving mid-download change it.
+        
+        Args:
+            count: Maximum number of pieces to return
+            
+        Returns:
+            Up to count pieces we lack that some connected peer has, fewest
+            holders first (lowest index on ties)
+        """
+        candidates = (i for i, peers in self._piece_to_peers.items()
+                      if peers and not self.has_piece(i))
+        return heapq.nsmallest(count, candidates,
+                               key=lambda i: (len(self._piece_to_peers[i]), i))
+
+    async def download_pieces(self, piece_lengths: Dict[int, int]) -> Dict[int, Optional[bytearray]]:
+        """
+        Download several pieces at once, spreading them across peers.
+        
+        Each piece goes to the least-loaded peer that has it (lowest latency
+        on ties). A connection carries one piece at a time, so every peer
+        works through its own queue while the peers run concurrently.
+        
+        Args:
+            piece_lengths: Size in bytes of each piece to download, by index
+            
+        Returns:
+            The data for each requested piece, or None where no peer had it
+            or the transfer failed
+        """
+        queues: Dict[PeerConnection, List[int]] = defaultdict(list)
+        for piece_index in piece_lengths:
+            candidates = self._piece_to_peers.get(piece_index)
+            if candidates:
+                peer = min(candidates,
+                           key=lambda p: (len(queues.get(p, ())), p.latency_ms))
+                queues[peer].append(piece_index)
+
+        results: Dict[int, Optional[bytearray]] = dict.fromkeys(piece_lengths)
+
+        async def drain(peer: PeerConnection, pieces: List[int]) -> None:
+            for piece_index in pieces:
+                results[piece_index] = await peer.download_piece(
+                    piece_index, piece_lengths[piece_index])
+                if not peer.alive:
+                    # Dropped or failed mid-transfer; stop routing pieces to it
+                    self.remove_peer(peer)
+                    break
+
+        await asyncio.gather(*(drain(peer, pieces) for peer, pieces in queues.items()),
+                             return_exceptions=True)
+        return results
 
     async def close_all(self) -> None:
         """Close all peer connections."""
-        async with self.lock:
-            for peer in self.peers.values():
-                await peer.close()
-            self.peers.clear()
\ No newline at end of file
+        with self._peers_lock:
+            peers = list(self.peers.values())
+            self.peers.clear()
+            self._peer_labels = None
+        self._piece_to_peers.clear()
+        self.close_resume_bitfield()
+        await asyncio.gather(*(peer.close() for peer in peers),
+                             return_exceptions=True)
\ No newline at end of file
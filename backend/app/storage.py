@@ -0,0 +1,103 @@
+"""
+Piece storage for the BitTorrent client.
+Writes verified pieces into the torrent's files at their final offsets.
+"""
+import os
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+from .torrent import TorrentInfo
+
+logger = logging.getLogger(__name__)
+
+_OPEN_FLAGS = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+
+
+class PieceWriter:
+    """Writes pieces straight to their offsets in the torrent's files."""
+
+    def __init__(self, info: TorrentInfo, root: str):
+        """
+        Map the torrent's byte range onto files under root.
+
+        Args:
+            info: Parsed info dictionary of the torrent
+            root: Directory the torrent's file (or top-level folder) goes in
+        """
+        self.piece_length = info.piece_length
+        # (path, first byte in the torrent, length), in torrent order
+        self._spans: List[Tuple[str, int, int]] = []
+        start = 0
+        if info.files:
+            base = os.path.join(root, _safe_relpath(info.name))
+            for f in info.files:
+                self._spans.append((os.path.join(base, _safe_relpath(f.path)), start, f.length))
+                start += f.length
+        else:
+            self._spans.append((os.path.join(root, _safe_relpath(info.name)), 0, info.length or 0))
+        self._fds: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _fd(self, path: str, length: int) -> int:
+        """Open (and on first use preallocate) one of the torrent's files."""
+        fd = self._fds.get(path)
+        if fd is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd = os.open(path, _OPEN_FLAGS, 0o644)
+            if os.fstat(fd).st_size < length:
+                # Reserve the whole file up front so piece writes don't fragment it
+                try:
+                    os.posix_fallocate(fd, 0, length)
+                except (AttributeError, OSError):
+                    os.ftruncate(fd, length)
+            self._fds[path] = fd
+        return fd
+
+    def write_piece(self, piece_index: int, data: bytes) -> None:
+        """
+        Write a verified piece, splitting it across file boundaries as needed.
+
+        Args:
+            piece_index: Index of the piece
+            data: The piece's bytes
+        """
+        start = piece_index * self.piece_length
+        end = start + len(data)
+        view = memoryview(data)
+        with self._lock:
+            for path, file_start, length in self._spans:
+                file_end = file_start + length
+                if file_end <= start or file_start >= end:
+                    continue
+                lo = max(start, file_start)
+                hi = min(end, file_end)
+                _pwrite_all(self._fd(path, length), view[lo - start:hi - start], lo - file_start)
+
+    def close(self) -> None:
+        """Close all open files."""
+        with self._lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
+
+
+def _safe_relpath(path: str) -> str:
+    """Turn a '/'-separated torrent path into a relative local path, rejecting escapes."""
+    parts = [p for p in path.replace('\\', '/').split('/') if p not in ('', '.')]
+    if not parts or '..' in parts:
+        raise ValueError(f"Unsafe path in torrent: {path!r}")
+    return os.path.join(*parts)
+
+
+def _pwrite_all(fd: int, data: memoryview, offset: int) -> None:
+    """Write all of data at offset without moving the file position."""
+    while data:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, data, offset)
+        else:
+            # No pwrite on Windows; callers hold PieceWriter._lock
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, data)
+        data = data[written:]
+        offset += written
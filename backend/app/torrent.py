@@ -4,6 +4,8 @@ Module for handling .torrent files and their metadata.
 import os
 import hashlib
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Union, TYPE_CHECKING
 from dataclasses import dataclass
 
@@ -11,6 +13,20 @@ from dataclasses import dataclass
 if TYPE_CHECKING:
     from .tracker import Tracker
 
+# hashlib releases the GIL while hashing large buffers, so a batch of
+# pieces can be verified on several cores at once
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+def _get_hash_pool() -> ThreadPoolExecutor:
+    """Return the shared piece-hashing pool, creating it on first use."""
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1,
+                                            thread_name_prefix='piece-hash')
+    return _hash_pool
+
 @dataclass
 class FileInfo:
     """Represents a file within a multi-file torrent."""
@@ -23,11 +39,69 @@ class TorrentInfo:
     """Represents the 'info' dictionary in a .torrent file."""
     name: str
     piece_length: int
-    pieces: List[bytes]  # List of 20-byte SHA-1 hashes
+    pieces_raw: bytes  # Concatenated 20-byte SHA-1 hashes
     private: bool = False
     files: Optional[List[FileInfo]] = None  # For multi-file torrents
     length: Optional[int] = None  # For single-file torrents
     md5sum: Optional[str] = None  # For single-file torrents
+    
+    @property
+    def num_pieces(self) -> int:
+        """Number of pieces in the torrent."""
+        return len(self.pieces_raw) // 20
+    
+    def piece(self, index: int) -> bytes:
+        """Get the 20-byte SHA-1 hash of the piece at ``index``."""
+        if not 0 <= index < self.num_pieces:
+            raise IndexError(f"Piece index out of range: {index}")
+        start = index * 20
+        return self.pieces_raw[start:start + 20]
+    
+    @property
+    def total_length(self) -> int:
+        """Total size of all files in bytes."""
+        if self.files:
+            return sum(f.length for f in self.files)
+        return self.length or 0
+    
+    def piece_size(self, index: int) -> int:
+        """Get the size in bytes of the piece at ``index`` (the last one may be short)."""
+        if not 0 <= index < self.num_pieces:
+            raise IndexError(f"Piece index out of range: {index}")
+        if index == self.num_pieces - 1:
+            return self.total_length - index * self.piece_length
+        return self.piece_length
+    
+    def verify_piece(self, index: int, data: Union[bytes, bytearray, memoryview]) -> bool:
+        """
+        Check downloaded piece data against its expected SHA-1 hash.
+        
+        Args:
+            index: The piece index
+            data: The complete piece data; any bytes-like object (including
+                a memoryview over an mmap) is hashed without copying
+        
+        Returns:
+            True if the data matches the piece hash
+        """
+        return hashlib.sha1(data).digest() == self.piece(index)
+
+    def verify_pieces(self, pieces: Dict[int, Union[bytes, bytearray, memoryview]]) -> Dict[int, bool]:
+        """
+        Check several pieces at once, hashing them in parallel.
+        
+        Args:
+            pieces: Complete piece data by piece index
+        
+        Returns:
+            Whether each piece matches its hash, by piece index
+        """
+        if len(pieces) < 2:
+            return {index: self.verify_piece(index, data) for index, data in pieces.items()}
+        digests = _get_hash_pool().map(lambda data: hashlib.sha1(data).digest(),
+                                       pieces.values())
+        return {index: digest == self.piece(index)
+                for index, digest in zip(pieces, digests)}
 
 class Torrent:
     """Represents a .torrent file and its metadata."""
@@ -41,6 +115,8 @@ class Torrent:
         """
         self.torrent_path = os.path.abspath(torrent_path)
         self.info_hash: bytes = b''
+        self.info_hash_hex: str = ''
+        self.peer_tag: str = ''
         self.announce: str = ''
         self.announce_list: List[List[str]] = []
         self.creation_date: Optional[int] = None
@@ -53,17 +129,17 @@ class Torrent:
     
     def _load_torrent_file(self) -> None:
         """Load and parse the .torrent file."""
-        import os
-        from .bencode import bdecode
-        
-        if not os.path.exists(self.torrent_path):
-            raise FileNotFoundError(f"Torrent file not found: {self.torrent_path}")
+        from .bencode import bdecode_with_info_span
         
-        with open(self.torrent_path, 'rb') as f:
-            data = f.read()
+        # Open directly rather than checking first: one syscall, no race
+        try:
+            with open(self.torrent_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Torrent file not found: {self.torrent_path}") from None
         
         try:
-            decoded = bdecode(data)
+            decoded, info_span = bdecode_with_info_span(data)
         except Exception as e:
             raise ValueError(f"Invalid .torrent file: {e}")
         
@@ -78,11 +154,16 @@ class Torrent:
             ]
         
         # Parse info dictionary
-        if b'info' not in decoded:
+        if info_span is None:
             raise ValueError("Invalid .torrent file: missing 'info' dictionary")
         
         info = decoded[b'info']
-        self.info_hash = hashlib.sha1(data[data.find(b'd8:infod'):data.find(b'e', data.find(b'd8:infod') + 8) + 1]).digest()
+        # Hash the info dict exactly as it appears in the file
+        self.info_hash = hashlib.sha1(data[info_span[0]:info_span[1]]).digest()
+        # Derived forms used in every tracker/peer message, computed once
+        self.info_hash_hex = self.info_hash.hex()
+        # 14-bit tag (00000-16383) used in diagnostic peer names
+        self.peer_tag = f"{hash(self.info_hash) & 0x3FFF:05d}"
         
         # Parse common fields
         self.creation_date = decoded.get(b'creation date')
@@ -98,7 +179,7 @@ class Torrent:
         # Common fields
         name = info[b'name'].decode('utf-8')
         piece_length = info[b'piece length']
-        pieces = [info[b'pieces'][i:i+20] for i in range(0, len(info[b'pieces']), 20)]
+        pieces_raw = info[b'pieces']
         private = bool(info.get(b'private', 0))
         
         # Handle single-file vs multi-file
@@ -106,7 +187,8 @@ class Torrent:
             # Multi-file torrent
             files = []
             for file_info in info[b'files']:
-                path = os.path.join(*[p.decode('utf-8') for p in file_info[b'path']])
+                # BEP-0003 paths are always '/'-separated, whatever the OS
+                path = b'/'.join(file_info[b'path']).decode('utf-8')
                 length = file_info[b'length']
                 md5sum = file_info.get(b'md5sum', b'').decode('utf-8') if b'md5sum' in file_info else None
                 files.append(FileInfo(path=path, length=length, md5sum=md5sum))
@@ -114,7 +196,7 @@ class Torrent:
             self.info = TorrentInfo(
                 name=name,
                 piece_length=piece_length,
-                pieces=pieces,
+                pieces_raw=pieces_raw,
                 private=private,
                 files=files
             )
@@ -126,7 +208,7 @@ class Torrent:
             self.info = TorrentInfo(
                 name=name,
                 piece_length=piece_length,
-                pieces=pieces,
+                pieces_raw=pieces_raw,
                 private=private,
                 length=length,
                 md5sum=md5sum
@@ -136,10 +218,7 @@ class Torrent:
         """Get the total size of all files in the torrent in bytes."""
         if not self.info:
             return 0
-            
-        if self.info.files:
-            return sum(f.length for f in self.info.files)
-        return self.info.length or 0
+        return self.info.total_length
     
     def get_file_list(self) -> List[str]:
         """Get a list of all files in the torrent."""
@@ -165,4 +244,4 @@ class Torrent:
         return (f"Torrent: {self.info.name}\n"
                 f"Size: {self.get_total_size() / (1024*1024):.2f} MB\n"
                 f"Files: {len(self.get_file_list())}\n"
-                f"Pieces: {len(self.info.pieces) if self.info else 0}")
\ No newline at end of file
+                f"Pieces: {self.info.num_pieces if self.info else 0}")
\ No newline at end of file
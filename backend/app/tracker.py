@@ -1,21 +1,47 @@
 """
 Module for communicating with BitTorrent trackers.
 """
+import base64
+import secrets
 import socket
-import random
 import urllib.parse
-import urllib.request
-import urllib.error
 import struct
 import time
 from typing import Dict, List, Tuple, Optional, Any
 from dataclasses import dataclass
 import logging
 
+import requests
+from requests.adapters import HTTPAdapter
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Compact peer entry: 4 IPv4 octets + big-endian port
+_COMPACT_PEER = struct.Struct("!BBBBH")
+
+# Query fields that are the same for every torrent and announce
+DEFAULT_PORT = 6881  # Default BitTorrent port
+_STATIC_QUERY = urllib.parse.urlencode({
+    'port': DEFAULT_PORT,
+    'compact': 1,  # Use compact response
+})
+
+# This client's peer ID, one per process: -PC0001-<12 random base32 chars>
+PEER_ID = b'-PC0001-' + base64.b32encode(secrets.token_bytes(9))[:12].lower()
+# Announce query fields that depend only on the peer ID
+_FIXED_QUERY = (f"peer_id={urllib.parse.quote_from_bytes(PEER_ID, safe='')}"
+                f"&{_STATIC_QUERY}")
+
+# The only announce response fields we act on
+_ANNOUNCE_KEYS = (b'failure reason', b'interval', b'min interval', b'peers')
+
+# Shared HTTP session so repeated announces reuse keep-alive/TLS connections
+_http = requests.Session()
+_http.mount('http://', HTTPAdapter(pool_maxsize=64))
+_http.mount('https://', HTTPAdapter(pool_maxsize=64))
+
 @dataclass
 class Peer:
     """Represents a peer in the BitTorrent network."""
@@ -41,7 +67,7 @@ class Tracker:
             torrent: The Torrent instance containing tracker information
         """
         self.torrent = torrent
-        self.peer_id = self._generate_peer_id()
+        self.peer_id = PEER_ID
         self.uploaded = 0
         self.downloaded = 0
         self.left = self.torrent.get_total_size()
@@ -49,43 +75,25 @@ class Tracker:
         self.interval = 1800  # Default interval in seconds
         self.min_interval = 300  # Minimum interval in seconds
         
-    def _generate_peer_id(self) -> bytes:
-        """Generate a unique peer ID for this client."""
-        # Format: -PC0001-<random-12-chars>
-        return ('-PC0001-' + ''.join(
-            random.choices('0123456789abcdefghijklmnopqrstuvwxyz', k=12)
-        )).encode()
-    
-    def _prepare_http_announce(self, event: str = '') -> Dict[str, str]:
-        """Prepare parameters for HTTP tracker announce."""
-        return {
-            'info_hash': self.torrent.info_hash,
-            'peer_id': self.peer_id,
-            'port': '6881',  # Default BitTorrent port
-            'uploaded': str(self.uploaded),
-            'downloaded': str(self.downloaded),
-            'left': str(max(0, self.left)),
-            'compact': '1',  # Use compact response
-            'event': event or 'started',
-        }
+        # Query field that stays the same for every announce of this torrent
+        self._info_hash_q = urllib.parse.quote_from_bytes(self.torrent.info_hash, safe='')
+        
+    def _prepare_http_announce(self, event: str = '') -> str:
+        """Prepare the query string for HTTP tracker announce."""
+        return (f"info_hash={self._info_hash_q}&{_FIXED_QUERY}"
+                f"&uploaded={self.uploaded}&downloaded={self.downloaded}"
+                f"&left={max(0, self.left)}&event={event or 'started'}")
     
     def _parse_peers_compact(self, peers_data: bytes) -> List[Peer]:
         """Parse compact peer list from tracker response."""
-        peers = []
-        # Compact format: <IP (4 bytes)><Port (2 bytes)>
-        for i in range(0, len(peers_data), 6):
-            if i + 6 > len(peers_data):
-                break
-                
-            ip_bytes = peers_data[i:i+4]
-            port_bytes = peers_data[i+4:i+6]
-            
-            ip = '.'.join(str(b) for b in ip_bytes)
-            port = struct.unpack('!H', port_bytes)[0]
-            
-            peers.append(Peer(ip=ip, port=port))
-            
-        return peers
+        # Compact format: <IP (4 bytes)><Port (2 bytes)>; a trailing
+        # partial entry is ignored
+        view = memoryview(peers_data)
+        view = view[:len(view) - len(view) % _COMPACT_PEER.size]
+        return [
+            Peer(ip=f"{a}.{b}.{c}.{d}", port=port)
+            for a, b, c, d, port in _COMPACT_PEER.iter_unpack(view)
+        ]
     
     def _parse_tracker_response(self, response: Dict[str, Any]) -> None:
         """Parse tracker response and update peer list."""
@@ -123,20 +131,23 @@ class Tracker:
         if not self.torrent.announce:
             raise TrackerError("No announce URL in torrent")
             
-        params = self._prepare_http_announce(event)
-        url = f"{self.torrent.announce}?{urllib.parse.urlencode(params)}"
+        query = self._prepare_http_announce(event)
+        separator = '&' if '?' in self.torrent.announce else '?'
+        url = f"{self.torrent.announce}{separator}{query}"
         
         logger.info(f"Announcing to tracker: {url}")
         
         try:
-            with urllib.request.urlopen(url, timeout=10) as response:
-                from bencode import bdecode
-                response_data = response.read()
-                decoded = bdecode(response_data)
-                self._parse_tracker_response(decoded)
-                return self.peers
+            response = _http.get(url, timeout=10)
+            response.raise_for_status()
+            from .bencode import bdecode_keys
+            decoded = bdecode_keys(response.content, _ANNOUNCE_KEYS)
+            self._parse_tracker_response(decoded)
+            return self.peers
                 
-        except urllib.error.URLError as e:
+        except TrackerError:
+            raise
+        except requests.RequestException as e:
             raise TrackerError(f"Failed to connect to tracker: {e}")
         except Exception as e:
             raise TrackerError(f"Error in tracker communication: {e}")
@@ -27,10 +27,20 @@ MAX_PEERS = int(os.getenv('MAX_PEERS', '50'))
 # ===== File Storage =====
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 TORRENT_FOLDER = os.path.join(BASE_DIR, 'torrents')
+# Where downloaded pieces are written (the torrent's own file layout under it)
+DOWNLOAD_FOLDER = os.getenv('DOWNLOAD_FOLDER') or os.path.join(BASE_DIR, 'downloads')
+# Upper bound on torrent metadata kept in memory (least recently stored are dropped)
+TORRENT_CACHE_MAX = int(os.getenv('TORRENT_CACHE_MAX', '4096'))
+# Upper bound on cached (path, size, mtime) -> info_hash entries used by directory scans
+INFO_HASH_CACHE_MAX = int(os.getenv('INFO_HASH_CACHE_MAX', '10000'))
+
+# Let a fronting server (e.g. nginx/Apache) send files via X-Sendfile
+USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', 'False').lower() in ('true', '1', 't')
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(TORRENT_FOLDER, exist_ok=True)
+os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 
 # ===== Tracker Settings =====
 TRACKER_INTERVAL = int(os.getenv('TRACKER_INTERVAL', '30'))  # seconds
@@ -39,11 +49,29 @@ TRACKER_TIMEOUT = int(os.getenv('TRACKER_TIMEOUT', '120'))  # seconds
 # ===== WebSocket Settings =====
 WEBSOCKET_PING_TIMEOUT = int(os.getenv('WEBSOCKET_PING_TIMEOUT', '30'))
 WEBSOCKET_PING_INTERVAL = int(os.getenv('WEBSOCKET_PING_INTERVAL', '10'))
+# 'threading' is the only mode the peer I/O thread supports (request threads
+# block on it, which would stall an eventlet/gevent hub); set it empty to let
+# Flask-SocketIO pick the fastest installed mode instead
+SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading') or None
+# Polling payloads at or below this size (bytes) are sent without gzip/deflate
+SOCKETIO_COMPRESSION_THRESHOLD = int(os.getenv('SOCKETIO_COMPRESSION_THRESHOLD', '1024'))
+# Transports the server accepts; add 'polling' for clients that cannot open websockets
+SOCKETIO_TRANSPORTS = [t.strip() for t in os.getenv('SOCKETIO_TRANSPORTS', 'websocket').split(',') if t.strip()]
+# Pub/sub queue (e.g. redis://localhost:6379) shared by several server
+# processes, so an emit from one reaches clients connected to the others
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE') or None
 
 # ===== Peer Configuration =====
 PEER_ID_PREFIX = os.getenv('PEER_ID_PREFIX', 'PEER_')
 MAX_RECONNECT_ATTEMPTS = int(os.getenv('MAX_RECONNECT_ATTEMPTS', '10'))
 RECONNECT_DELAY = int(os.getenv('RECONNECT_DELAY', '2000'))  # ms
+PEER_CONNECT_TIMEOUT = float(os.getenv('PEER_CONNECT_TIMEOUT', '5'))  # seconds, connect + handshake
+# Longest a request thread waits on the peer I/O loop (connect batch, download batch)
+PEER_LOOP_TIMEOUT = float(os.getenv('PEER_LOOP_TIMEOUT', '300'))  # seconds
+# Reconnect to the peers saved by the last connect (if younger than the TTL)
+# and only announce to the tracker when fewer than PEER_CACHE_MIN_PEERS answer
+PEER_CACHE_TTL = int(os.getenv('PEER_CACHE_TTL', '300'))  # seconds
+PEER_CACHE_MIN_PEERS = int(os.getenv('PEER_CACHE_MIN_PEERS', '1'))
 
 # ===== Application Settings =====
 DEBUG = os.getenv('DEBUG', 'False').lower() in ('true', '1', 't')
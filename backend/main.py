@@ -3,40 +3,314 @@ Main entry point for the Peer2Peer Torrent Client (Host Machine)
 """
 import os
 import asyncio
+import atexit
+import concurrent.futures
+import functools
 import hashlib
+import json
+import logging
+import re
 import socket
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
 from datetime import datetime
 from flask import Flask, render_template, jsonify, request, send_from_directory, current_app
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 from config import (
     HOST, PORT, TRACKER_URL, VM_IP, VM_PORT, 
     WEBSOCKET_PING_TIMEOUT, WEBSOCKET_PING_INTERVAL,
-    MAX_RECONNECT_ATTEMPTS, RECONNECT_DELAY
+    MAX_RECONNECT_ATTEMPTS, RECONNECT_DELAY, MAX_PEERS, SOCKETIO_ASYNC_MODE,
+    USE_X_SENDFILE, DEBUG, LOG_LEVEL, TORRENT_CACHE_MAX,
+    SOCKETIO_COMPRESSION_THRESHOLD, SOCKETIO_TRANSPORTS, INFO_HASH_CACHE_MAX,
+    TORRENT_FOLDER, UPLOAD_FOLDER, LOG_FORMAT, PEER_CONNECT_TIMEOUT,
+    PEER_CACHE_TTL, PEER_CACHE_MIN_PEERS, DOWNLOAD_FOLDER, SOCKETIO_MESSAGE_QUEUE,
+    PEER_LOOP_TIMEOUT
 )
 
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# The peer I/O loop (see peer_loop) is a libuv loop when uvloop is installed
+if uvloop is not None:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
 # Import app modules
-from app.peer import PeerManager, BlockRequest
+from app.peer import PeerManager
+from app.storage import PieceWriter
 from app.torrent import Torrent
 from app.tracker import Tracker
+from app.bencode import find_info_span, IncrementalInfoHasher, BencodeDecodeError
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+# (10 ms tick, ISO string) of the last timestamp handed out by now_iso()
+_now_iso_cache = (0, '')
+
+def now_iso():
+    """Current UTC time in ISO format for event payloads, reused within a 10 ms tick."""
+    global _now_iso_cache
+    now = time.time()
+    tick = int(now * 100)
+    if tick != _now_iso_cache[0]:
+        _now_iso_cache = (tick, datetime.utcfromtimestamp(now).isoformat())
+    return _now_iso_cache[1]
+
+# Common spellings are checked with a plain suffix test; the regex only
+# runs for names that miss it, to keep the check case-insensitive
+TORRENT_SUFFIXES = ('.torrent', '.Torrent', '.TORRENT')
+_TORRENT_SUFFIX_RE = re.compile(r'\.torrent\Z', re.IGNORECASE)
+
+def is_torrent_filename(name):
+    """Return True if the file name has a .torrent extension (any case)."""
+    return name.endswith(TORRENT_SUFFIXES) or _TORRENT_SUFFIX_RE.search(name) is not None
+
+def json_dumps(obj):
+    """Serialize obj to a compact JSON string, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            # e.g. non-string dict keys; the stdlib encoder handles those
+            pass
+    return json.dumps(obj, separators=(',', ':'))
+
+def json_loads(s):
+    """Parse a JSON document, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
+
+# Read/write size used when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+def write_stream(stream, path, size_hint=0):
+    """
+    Copy a binary stream to a new file, yielding each chunk once it is written.
+    
+    Args:
+        stream: Readable binary stream (e.g. an upload's FileStorage.stream)
+        path: Destination file; created or truncated
+        size_hint: Expected upper bound on the size, used to preallocate the
+            file in one extent; the file is trimmed to the bytes written
+            
+    Yields:
+        Each chunk of data after it has been written
+    """
+    # Unbuffered 1 MB writes; the chunks are already large, so a
+    # BufferedWriter would only add a copy
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if size_hint and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, size_hint)
+            except OSError:
+                size_hint = 0  # Not supported by this filesystem
+        written = 0
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(fd, view):]
+            written += len(chunk)
+            yield chunk
+        if size_hint > written:
+            os.ftruncate(fd, written)
+    finally:
+        os.close(fd)
+
+# /api/config only exposes settings fixed at startup, so serialize it once
+CONFIG_JSON = json_dumps({
+    'trackerUrl': TRACKER_URL,
+    'vmIp': VM_IP,
+    'vmPort': VM_PORT,
+    'reconnectAttempts': MAX_RECONNECT_ATTEMPTS,
+    'reconnectDelay': RECONNECT_DELAY,
+    'pingTimeout': WEBSOCKET_PING_TIMEOUT,
+    'pingInterval': WEBSOCKET_PING_INTERVAL
+})
+
+# Constant parts of the test_connection replies
+TEST_CONNECTION_MESSAGE = {
+    'type': 'success',
+    'message': 'Connection test successful'
+}
+TEST_CONNECTION_RESPONSE = {
+    'status': 'success',
+    'server_version': '1.0.0',
+    'message': f'Connected to {HOST}:{PORT}'
+}
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes compact responses with orjson."""
+    
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            # Pretty-printed debug output and custom options go to the stdlib
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            return super().dumps(obj)
+    
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Same argument rules as jsonify(): one value, several (a list), keywords
+        # (a dict) or nothing (null)
+        if args and kwargs:
+            raise TypeError("response() takes either args or kwargs, not both")
+        if len(args) == 1:
+            obj = args[0]
+        else:
+            obj = list(args) or kwargs or None
+        if orjson is not None and (self.compact or (self.compact is None and not current_app.debug)):
+            # Hand orjson's bytes straight to the response, skipping the
+            # decode in dumps() and Werkzeug's re-encode
+            try:
+                return current_app.response_class(
+                    orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE),
+                    mimetype=self.mimetype)
+            except TypeError:
+                pass
+        return super().response(obj)
+
+class RawJSON(str):
+    """A value that has already been serialized to JSON."""
+
+class PacketJSON:
+    """
+    JSON module for Socket.IO packets that writes RawJSON values verbatim.
+    
+    RawJSON is honoured as an event argument or as a value of a dict
+    argument, which is enough to reuse a pre-serialized list inside a
+    response without encoding it again.
+    """
+    
+    @staticmethod
+    def _dumps(obj, **kwargs):
+        if isinstance(obj, RawJSON):
+            return obj
+        if isinstance(obj, dict) and any(isinstance(v, RawJSON) for v in obj.values()):
+            return '{' + ','.join(
+                json_dumps(str(k)) + ':' + PacketJSON._dumps(v, **kwargs)
+                for k, v in obj.items()
+            ) + '}'
+        return json_dumps(obj)
+    
+    @staticmethod
+    def dumps(obj, **kwargs):
+        if isinstance(obj, list):
+            return '[' + ','.join(PacketJSON._dumps(item, **kwargs) for item in obj) + ']'
+        return PacketJSON._dumps(obj, **kwargs)
+    
+    @staticmethod
+    def loads(s, **kwargs):
+        return json_loads(s)
+
+def load_peer_cache(path, ttl):
+    """
+    Read the peer addresses saved by save_peer_cache.
+    
+    Args:
+        path: Cache file to read
+        ttl: Maximum age of the file in seconds; it is only rewritten after a
+            tracker announce, so this bounds the time since the last announce
+        
+    Returns:
+        List of (ip, port) pairs; empty if the file is missing, stale or unreadable
+    """
+    try:
+        if time.time() - os.stat(path).st_mtime > ttl:
+            return []
+        with open(path, 'rb') as f:
+            return [(ip, int(port)) for ip, port in json_loads(f.read())]
+    except (OSError, ValueError, TypeError):
+        return []
+
+def save_peer_cache(path, addresses):
+    """Atomically replace the peer cache file with the given (ip, port) pairs."""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(json_dumps([[ip, port] for ip, port in addresses]))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not save peer cache %s: %s", path, e)
+
+class LRUCache(OrderedDict):
+    """Dict that evicts the least recently stored entries beyond maxsize."""
+    
+    def __init__(self, maxsize):
+        super().__init__()
+        self.maxsize = maxsize
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+# Recent debug lines per thread, only formatted and logged if a request fails
+_trace_local = threading.local()
+
+def trace(msg, *args):
+    """Record a debug line for the current request without formatting it."""
+    lines = getattr(_trace_local, 'lines', None)
+    if lines is None:
+        lines = _trace_local.lines = deque(maxlen=256)
+    lines.append((msg, args))
+    logger.debug(msg, *args)
+
+def dump_trace():
+    """Log the current thread's recent debug lines at ERROR level and clear them."""
+    lines = getattr(_trace_local, 'lines', None)
+    if lines:
+        for msg, args in lines:
+            logger.error(msg, *args)
+        lines.clear()
+
+def clear_trace():
+    """Drop the current thread's debug lines; called as each request starts."""
+    lines = getattr(_trace_local, 'lines', None)
+    if lines:
+        lines.clear()
 
 def create_app():
     """Create and configure the Flask application."""
     app = Flask(__name__,
               static_folder='web/static',
               template_folder='web/templates')
-              
-    # Ensure upload directory exists
-    upload_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-    os.makedirs(upload_dir, exist_ok=True)
-    app.config['UPLOAD_FOLDER'] = upload_dir
 
     # Basic configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-123')
-    app.config['UPLOAD_FOLDER'] = 'uploads'
+    # Absolute and created once by config at import, so handlers never stat it
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
     app.config['TRACKER_URL'] = TRACKER_URL  # Set tracker URL from config
     app.config['TEMPLATES_AUTO_RELOAD'] = True
+    app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
+    app.config['torrents'] = LRUCache(TORRENT_CACHE_MAX)
+    app.json = OrjsonProvider(app)
 
     # Initialize CORS with more permissive settings
     CORS(app, resources={
@@ -50,15 +324,19 @@ def create_app():
 
     socketio = SocketIO(
         app,
-        async_mode='threading',
+        async_mode=SOCKETIO_ASYNC_MODE,
+        message_queue=SOCKETIO_MESSAGE_QUEUE,
         cors_allowed_origins="*",
-        logger=True,
-        engineio_logger=True,
+        logger=DEBUG,
+        engineio_logger=DEBUG,
+        json=PacketJSON,
         ping_timeout=30,
         ping_interval=10,
         max_http_buffer_size=1e8,  # 100MB max message size
         allow_upgrades=True,
+        transports=SOCKETIO_TRANSPORTS,
         http_compression=True,
+        compression_threshold=SOCKETIO_COMPRESSION_THRESHOLD,
         async_handlers=True,
         always_connect=True
     )
@@ -71,18 +349,19 @@ def create_app():
         try:
             print(f"🔌 Connecting Host Flask app to tracker: {TRACKER_URL}")
             
-            # Import the correct Client class
-            import socketio
+            # Import the correct Client class (aliased so the Flask-SocketIO
+            # server below stays reachable for forwarding)
+            import socketio as socketio_client
             
             # Create a new client instance
-            tracker_socket = socketio.Client(
+            tracker_socket = socketio_client.Client(
                 reconnection=True,
                 reconnection_attempts=5,
                 reconnection_delay=1,
                 reconnection_delay_max=5,
                 randomization_factor=0.5,
-                logger=True,
-                engineio_logger=True
+                logger=DEBUG,
+                engineio_logger=DEBUG
             )
             
             @tracker_socket.event
@@ -119,6 +398,8 @@ def create_app():
             
             # Connect to the tracker
             try:
+                # A single websocket avoids the long-polling request threads;
+                # polling is only used if websocket-client is unavailable
                 tracker_socket.connect(
                     TRACKER_URL,
                     transports=['websocket', 'polling'],
@@ -139,33 +420,116 @@ def create_app():
             print(f"❌ Failed to initialize tracker connection: {e}")
             return False
 
-    # Call this when the app starts
-    connect_to_tracker()
+    # Connect in the background so app startup doesn't wait on the tracker
+    socketio.start_background_task(connect_to_tracker)
 
     # Configuration endpoint
     @app.route('/api/config')
     def get_config():
-        return jsonify({
-            'trackerUrl': TRACKER_URL,
-            'vmIp': VM_IP,
-            'vmPort': VM_PORT,
-            'reconnectAttempts': MAX_RECONNECT_ATTEMPTS,
-            'reconnectDelay': RECONNECT_DELAY,
-            'pingTimeout': WEBSOCKET_PING_TIMEOUT,
-            'pingInterval': WEBSOCKET_PING_INTERVAL
-        })
+        return app.response_class(CONFIG_JSON, mimetype='application/json')
         
     # File upload endpoint is now at /api/torrents
 
-    # Global peer manager
-    peer_manager = None
-    current_torrent = None
+    # Download state per info_hash: the torrent, its tracker session (peer_id,
+    # stats), peer manager (open connections) and piece writer (open files).
+    # Created once under the lock and reused by every later request.
+    sessions = {}
+    sessions_lock = threading.Lock()
+    # Torrent used when a request doesn't name one: the last one connected
+    current_hash = None
+    # Parsed torrents keyed on (path, size, mtime), so unchanged files aren't re-parsed
+    torrent_cache = LRUCache(32)
+
+    def get_session(info_hash_hex=None):
+        """Return a torrent's download state (default: the last connected), or None."""
+        if not info_hash_hex:
+            return sessions.get(current_hash)
+        try:
+            return sessions.get(bytes.fromhex(info_hash_hex))
+        except ValueError:
+            return None
+
+    def close_session(session):
+        """Release a session's peer connections, resume file and download files."""
+        try:
+            # Also closes the resume bitfield
+            run_on_peer_loop(session['peer_manager'].close_all(), timeout=10)
+        except Exception as e:
+            logger.warning("Error closing peers of %s: %s", session['torrent'].info_hash_hex, e)
+        session['piece_writer'].close()
+
+    @atexit.register
+    def close_sessions():
+        """Close every session when the process exits."""
+        with sessions_lock:
+            closing = list(sessions.values())
+            sessions.clear()
+        for session in closing:
+            close_session(session)
+
+    # Newest unsent progress update per torrent, flushed by one background task
+    pending_progress = {}
+    progress_flusher = None
+
+    def flush_download_progress():
+        """Emit queued progress updates, at most one per torrent every 100 ms."""
+        while True:
+            socketio.sleep(0.1)
+            while pending_progress:
+                _, update = pending_progress.popitem()
+                socketio.emit('register_peer', update)
+
+    def queue_download_progress(torrent_hash, update):
+        """Queue a progress update, replacing any not yet sent for the same torrent."""
+        nonlocal progress_flusher
+        pending_progress[torrent_hash] = update
+        if progress_flusher is None:
+            progress_flusher = socketio.start_background_task(flush_download_progress)
+
+    # Per-client outbound server_message queues, each drained by one writer task
+    client_queues = {}
+
+    def server_message_writer(sid, queue):
+        """Send a client's queued server messages, coalescing bursts into one frame."""
+        queue_empty = socketio.server.eio.get_queue_empty_exception()
+        stop = False
+        while not stop:
+            message = queue.get()
+            if message is None:
+                break
+            messages = [message]
+            while True:
+                try:
+                    message = queue.get_nowait()
+                except queue_empty:
+                    break
+                if message is None:
+                    stop = True
+                    break
+                messages.append(message)
+            
+            if len(messages) == 1:
+                socketio.emit('server_message', messages[0], to=sid)
+            else:
+                socketio.emit('server_message_batch', messages, to=sid)
+
+    def queue_server_message(sid, message):
+        """Queue a server_message for a client, sending directly if it has no queue."""
+        queue = client_queues.get(sid)
+        if queue is None:
+            socketio.emit('server_message', message, to=sid)
+        else:
+            queue.put(message)
 
     # WebSocket event handlers
     @socketio.on('connect')
     def handle_connect():
         print(f"Client connected: {request.sid}")
         
+        queue = socketio.server.eio.create_queue()
+        client_queues[request.sid] = queue
+        socketio.start_background_task(server_message_writer, request.sid, queue)
+        
         # Register this client as a peer with the tracker IMMEDIATELY
         emit('register_peer', {
             'peer_id': f'HOST_PEER_{request.sid[-6:]}',
@@ -175,6 +539,7 @@ def create_app():
             'capabilities': ['download', 'upload']
         })
         
+        # Sent inline: the writer task can't reach a client mid-handshake
         emit('server_message', {
             'type': 'success',
             'message': 'Connected to P2P Client and registered with tracker as peer'
@@ -184,7 +549,7 @@ def create_app():
     def handle_register_peer(data):
         """Handle peer registration response from tracker"""
         print(f"Peer registration response: {data}")
-        emit('server_message', {
+        queue_server_message(request.sid, {
             'type': 'success',
             'message': f'Registered as peer with tracker: {data.get("peer_id", "unknown")}'
         })
@@ -195,30 +560,26 @@ def create_app():
         print(f"Test connection from {request.sid}: {data}")
         
         # Send server_message response
-        emit('server_message', {
-            'type': 'success',
-            'message': 'Connection test successful'
-        })
+        queue_server_message(request.sid, TEST_CONNECTION_MESSAGE)
         
         # Also send test_connection_response for backward compatibility
         emit('test_connection_response', 
-             {
-                 'status': 'success',
-                 'server_time': str(datetime.utcnow()),
-                 'server_version': '1.0.0',
-                 'client_id': request.sid,
-                 'message': f'Connected to {HOST}:{PORT}'
-             },
+             dict(TEST_CONNECTION_RESPONSE,
+                  server_time=str(datetime.utcnow()),
+                  client_id=request.sid),
              room=request.sid)
 
     @socketio.on('disconnect')
-    def handle_disconnect():
+    def handle_disconnect(reason=None):
         print(f'Client disconnected: {request.sid}')
+        queue = client_queues.pop(request.sid, None)
+        if queue is not None:
+            queue.put(None)  # Stop the writer task
 
     @socketio.on_error_default
     def error_handler(e):
         print(f'WebSocket error: {str(e)}')
-        emit('server_message', {
+        queue_server_message(request.sid, {
             'type': 'error',
             'message': f'WebSocket error: {str(e)}'
         })
@@ -227,7 +588,7 @@ def create_app():
     @socketio.on('torrent_uploaded')
     def handle_torrent_uploaded(data):
         print(f"Torrent uploaded: {data}")
-        emit('server_message', {
+        queue_server_message(request.sid, {
             'type': 'success',
             'message': f'Torrent {data.get("filename", "unknown")} uploaded successfully'
         })
@@ -235,7 +596,7 @@ def create_app():
     @socketio.on('download_started')
     def handle_download_started(data):
         print(f"Download started: {data}")
-        emit('server_message', {
+        queue_server_message(request.sid, {
             'type': 'info',
             'message': f'Download started for piece {data.get("piece_index", 0)}'
         })
@@ -243,7 +604,7 @@ def create_app():
     @socketio.on('download_complete')
     def handle_download_complete(data):
         print(f"Download complete: {data}")
-        emit('server_message', {
+        queue_server_message(request.sid, {
             'type': 'success',
             'message': 'Download completed successfully'
         })
@@ -251,120 +612,161 @@ def create_app():
     @socketio.on('download_error')
     def handle_download_error(data):
         print(f"Download error: {data}")
-        emit('server_message', {
+        queue_server_message(request.sid, {
             'type': 'error',
             'message': f'Download error: {data.get("error", "Unknown error")}'
         })
 
-    # Ensure upload folder exists
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # Last scan result per directory, keyed on the directory listing's stats
+    scan_cache = {}
+    # info_hash per (path, size, mtime_ns), so unchanged files are never re-hashed
+    info_hash_cache = LRUCache(INFO_HASH_CACHE_MAX)
+    # Serialized form of the last torrents list sent to clients
+    torrents_json_cache = {'torrents': None, 'json': None}
+
+    def torrents_json(torrents):
+        """Return the torrents list as RawJSON, reusing it while the scan result is unchanged."""
+        # Cached scan results share the same list object until the directory changes
+        if torrents_json_cache['torrents'] is not torrents:
+            torrents_json_cache['json'] = RawJSON(json_dumps(torrents))
+            torrents_json_cache['torrents'] = torrents
+        return torrents_json_cache['json']
+
+    def torrents_directory_key(torrents_dir):
+        """Build a cache key from the directory mtime and each entry's size/mtime."""
+        with os.scandir(torrents_dir) as entries:
+            files = sorted(
+                (entry.name, st.st_size, st.st_mtime_ns)
+                for entry in entries
+                for st in (entry.stat(),)
+            )
+        return os.stat(torrents_dir).st_mtime_ns, tuple(files)
 
     def scan_torrents_directory(torrents_dir, request_id=None):
         """Scan the torrents directory and return a list of torrent files with metadata."""
         if request_id is None:
             request_id = str(uuid.uuid4())[:8]
             
-        print(f"\n{'='*50}")
-        print(f"[{request_id}] SCANNING TORRENT DIRECTORY")
-        print(f"{'='*50}")
-        print(f"[{request_id}] Directory: {torrents_dir}")
+        trace("[%s] Scanning torrent directory: %s", request_id, torrents_dir)
         
-        if not os.path.exists(torrents_dir):
+        # The cache key's scandir/stat doubles as the existence check
+        try:
+            dir_key = torrents_directory_key(torrents_dir)
+        except FileNotFoundError:
+            dir_key = None
             try:
                 os.makedirs(torrents_dir, exist_ok=True)
-                print(f"[{request_id}] Created directory: {torrents_dir}")
+                trace("[%s] Created directory: %s", request_id, torrents_dir)
             except Exception as e:
                 error_msg = f"Failed to create directory: {str(e)}"
-                print(f"[{request_id}] {error_msg}")
+                logger.error("[%s] %s", request_id, error_msg)
                 return {'success': False, 'error': error_msg, 'torrents': []}
-        
-        if not os.path.isdir(torrents_dir):
+        except NotADirectoryError:
             error_msg = f"Path is not a directory: {torrents_dir}"
-            print(f"[{request_id}] {error_msg}")
+            logger.error("[%s] %s", request_id, error_msg)
             return {'success': False, 'error': error_msg, 'torrents': []}
+        except OSError as e:
+            dir_key = None
+            logger.warning("[%s] Could not stat directory, skipping cache: %s", request_id, e)
+        
+        cached = scan_cache.get(torrents_dir)
+        if dir_key is not None and cached is not None and cached[0] == dir_key:
+            trace("[%s] Directory unchanged, using cached scan result", request_id)
+            return dict(cached[1], request_id=request_id)
         
         torrents = []
         try:
-            # List all files in the directory
-            all_files = os.listdir(torrents_dir)
-            print(f"\n[{request_id}] Found {len(all_files)} items in directory:")
-            
-            # Filter for .torrent files (case-insensitive)
-            torrent_files = [f for f in all_files if f.lower().endswith('.torrent')]
-            print(f"[{request_id}] Found {len(torrent_files)} .torrent files: {torrent_files}")
+            # List the .torrent files in the directory (case-insensitive)
+            with os.scandir(torrents_dir) as it:
+                torrent_entries = [entry for entry in it if is_torrent_filename(entry.name)]
+            trace("[%s] Found %d .torrent files", request_id, len(torrent_entries))
             
             # Process each .torrent file
-            for filename in torrent_files:
+            for entry in torrent_entries:
+                filename = entry.name
                 filepath = os.path.join(torrents_dir, filename)
-                if not os.path.isfile(filepath):
-                    print(f"[{request_id}] Skipping non-file: {filepath}")
-                    continue
                 
                 try:
-                    # Get file metadata
-                    file_size = os.path.getsize(filepath)
-                    file_mtime = os.path.getmtime(filepath)
+                    if not entry.is_file():
+                        trace("[%s] Skipping non-file: %s", request_id, filepath)
+                        continue
                     
-                    # Read file content to compute hash
-                    with open(filepath, 'rb') as f:
-                        file_content = f.read()
+                    # Get file metadata from a single stat call
+                    st = entry.stat()
+                    file_size, file_mtime = st.st_size, st.st_mtime
                     
-                    if not file_content:
-                        print(f"[{request_id}] Warning: {filename} is empty")
+                    if not file_size:
+                        logger.warning("[%s] %s is empty", request_id, filename)
                         continue
                     
-                    # Compute info hash
-                    info_hash = compute_torrent_info_hash(file_content)
+                    hash_key = (filepath, file_size, st.st_mtime_ns)
+                    info_hash = info_hash_cache.get(hash_key)
+                    if info_hash is None:
+                        # Read file content to compute hash
+                        with open(filepath, 'rb') as f:
+                            file_content = f.read()
+                        info_hash = compute_torrent_info_hash(file_content)
+                        info_hash_cache[hash_key] = info_hash
+                    
+                    # Uploads are stored as <info_hash>.torrent; show the
+                    # name they were uploaded with while it is still known
+                    display_name = filename
+                    if filename == f"{info_hash}.torrent":
+                        known = app.config['torrents'].get(info_hash)
+                        if known is not None:
+                            display_name = known['filename']
                     
                     # Create torrent data
                     torrent_data = {
-                        'filename': filename,
+                        'filename': display_name,
                         'filepath': filepath,
                         'size': file_size,
-                        'uploaded_at': datetime.datetime.fromtimestamp(file_mtime).isoformat(),
+                        'uploaded_at': datetime.fromtimestamp(file_mtime).isoformat(),
                         'info_hash': info_hash,
                         'peers': []
                     }
                     
                     torrents.append(torrent_data)
-                    print(f"[{request_id}] Processed: {filename} (hash: {info_hash[:8]}..., size: {file_size} bytes)")
+                    trace("[%s] Processed: %s (hash: %s..., size: %d bytes)",
+                          request_id, filename, info_hash[:8], file_size)
                     
                 except Exception as e:
-                    print(f"[{request_id}] Error processing {filename}: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
+                    logger.error("[%s] Error processing %s: %s", request_id, filename, e)
+                    logger.debug(traceback.format_exc())
                     continue
             
-            print(f"\n[{request_id}] Successfully processed {len(torrents)} torrent files")
-            return {
+            trace("[%s] Successfully processed %d torrent files", request_id, len(torrents))
+            result = {
                 'success': True,
                 'torrents': torrents,
                 'count': len(torrents),
                 'request_id': request_id
             }
+            if dir_key is not None:
+                scan_cache[torrents_dir] = (dir_key, result)
+            return result
             
         except Exception as e:
             error_msg = f"Error scanning directory: {str(e)}"
-            print(f"[{request_id}] {error_msg}")
-            import traceback
-            traceback.print_exc()
+            dump_trace()
+            logger.exception("[%s] %s", request_id, error_msg)
             return {'success': False, 'error': error_msg, 'torrents': []}
     
     @socketio.on('get_torrents')
     def handle_get_torrents(callback=None):
         """Handle request for list of available torrents"""
+        clear_trace()
         request_id = str(uuid.uuid4())[:8]
-        print(f"\n=== Handling get_torrents request ===")
-        print(f"Request ID: {request_id}")
+        trace("[%s] Handling get_torrents request", request_id)
         
         try:
             # Get the torrents directory
-            torrents_dir = os.path.abspath(app.config['UPLOAD_FOLDER'])
-            print(f"[{request_id}] Scanning directory: {torrents_dir}")
+            torrents_dir = app.config['UPLOAD_FOLDER']
             
             # Scan the directory for torrent files
             result = scan_torrents_directory(torrents_dir, request_id)
-            print(f"[{request_id}] Scan result - Success: {result.get('success', False)}, Found {len(result.get('torrents', []))} torrents")
+            trace("[%s] Scan result - Success: %s, Found %d torrents", request_id,
+                  result.get('success', False), len(result.get('torrents', [])))
             
             # Ensure we have the expected structure
             if 'torrents' not in result:
@@ -372,125 +774,52 @@ def create_app():
             
             # Update in-memory storage
             if result['success']:
-                # Initialize in-memory storage if it doesn't exist
-                if 'torrents' not in app.config:
-                    app.config['torrents'] = {}
-                
                 # Update in-memory storage with the latest torrents
                 for torrent in result['torrents']:
                     if 'info_hash' in torrent:
                         app.config['torrents'][torrent['info_hash']] = torrent
-                
-                print(f"[{request_id}] Updated in-memory storage with {len(result['torrents'])} torrents")
+            
+            trace("[%s] Emitting torrents_list with %d torrents", request_id, len(result['torrents']))
+            result = dict(result, torrents=torrents_json(result['torrents']))
             
             # If this was a callback request, send the response back
             if callable(callback):
-                print(f"[{request_id}] Sending callback response")
                 callback(result)
             
             # Always emit the torrents_list event
-            print(f"[{request_id}] Emitting torrents_list event with {len(result['torrents'])} torrents")
             socketio.emit('torrents_list', result)
             
-            print(f"[{request_id}] Request completed successfully")
             return result
             
         except Exception as e:
             error_msg = f"Error processing torrents request: {str(e)}"
-            print(f"[{request_id}] {error_msg}")
-            import traceback
-            traceback.print_exc()
+            dump_trace()
+            logger.exception("[%s] %s", request_id, error_msg)
             error_result = {'success': False, 'error': error_msg, 'torrents': []}
             if callable(callback):
-                print(f"[{request_id}] Sending error callback")
                 callback(error_result)
-            print(f"[{request_id}] Emitting error event")
             socketio.emit('torrents_list', error_result)
             return error_result
-            # Get the torrents list
-            result = get_torrents_list()
-            
-            # Ensure we have the expected structure
-            if not isinstance(result, dict) or 'torrents' not in result:
-                result = {
-                    'success': True,
-                    'torrents': result if isinstance(result, list) else [],
-                    'count': len(result) if isinstance(result, list) else 0,
-                    'request_id': request_id
-                }
-            
-            # Add timestamp
-            result['timestamp'] = datetime.datetime.utcnow().isoformat()
-            
-            # If callback is provided, use it
-            if callable(callback):
-                print(f"[{request_id}] Sending response via callback")
-                try:
-                    callback(result)
-                except Exception as e:
-                    print(f"[{request_id}] Error in callback: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
-            
-            # Always emit the event
-            print(f"[{request_id}] Emitting torrents_list event with {len(result.get('torrents', []))} torrents")
-            socketio.emit('torrents_list', result)
-            
-            # Return the response for direct calls
-            return result
-                
-        except Exception as e:
-            error_msg = f'Error getting torrents: {str(e)}'
-            print(error_msg)
-            import traceback
-            traceback.print_exc()
-            error_response = {
-                'success': False,
-                'error': error_msg,
-                'torrents': [],
-                'count': 0,
-                'request_id': request_id,
-                'timestamp': datetime.datetime.utcnow().isoformat()
-            }
-            
-            print(f"[{request_id}] Error response: {error_response}")
-            
-            if callable(callback):
-                try:
-                    callback(error_response)
-                except Exception as e:
-                    print(f"[{request_id}] Error in error callback: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
-            
-            # Always emit the error event
-            socketio.emit('torrents_list', error_response)
-                
-            return error_response
 
-    @socketio.on('download_started')
-    def handle_download_started(data):
-        print(f"Download started: {data}")
-        emit('server_message', {
-            'type': 'info',
-            'message': f'Download started for piece {data.get("piece_index", 0)}'
-        })
+    # Whether a background rescan is queued but not yet started; uploads in
+    # the meantime are covered by that one scan
+    refresh_state = {'pending': False, 'lock': threading.Lock()}
 
-    @socketio.on('download_complete')
-    def handle_download_complete(data):
-        print(f"Download complete: {data}")
-        emit('server_message', {
-            'type': 'success',
-            'message': 'Download completed successfully'
-        })
+    def refresh_torrents_list():
+        """Rescan the upload folder and broadcast torrents_list (background task)."""
+        with refresh_state['lock']:
+            refresh_state['pending'] = False
+        handle_get_torrents()
 
-    @socketio.on('download_error')
-    def handle_download_error(data):
-        print(f"Download error: {data}")
-        emit('server_message', {
-            'type': 'error',
-            'message': f'Download error: {data.get("error", "Unknown error")}'
-        })
+    def schedule_torrents_refresh():
+        """Queue a background rescan unless one is already waiting to run."""
+        with refresh_state['lock']:
+            if refresh_state['pending']:
+                return
+            refresh_state['pending'] = True
+        socketio.start_background_task(refresh_torrents_list)
+
+    app.extensions['schedule_torrents_refresh'] = schedule_torrents_refresh
 
     # Register routes
     @app.route('/')
@@ -514,21 +843,22 @@ def create_app():
 
     def compute_torrent_info_hash(torrent_data):
         """Compute the info_hash of a torrent file."""
-        import hashlib
-        import bencodepy
-        
         try:
-            # Parse the torrent file
-            metadata = bencodepy.decode(torrent_data)
-            # Get the 'info' dictionary and re-encode it
-            info = metadata[b'info']
-            info_hash = hashlib.sha1(bencodepy.encode(info)).hexdigest()
-            return info_hash
+            # Hash the info dict's bytes in place; nothing else is decoded
+            span = find_info_span(torrent_data)
+            if span is None:
+                raise ValueError("missing 'info' dictionary")
+            return hashlib.sha1(memoryview(torrent_data)[span[0]:span[1]]).hexdigest()
         except Exception as e:
             print(f"Error computing info_hash: {e}")
             # Fallback to MD5 of filename if we can't parse the torrent
             return hashlib.md5(torrent_data).hexdigest()[:8]
 
+    # Worker threads are reused, so start each request with an empty trace
+    @app.before_request
+    def before_request():
+        clear_trace()
+
     # Add CORS headers to all responses
     @app.after_request
     def after_request(response):
@@ -538,6 +868,7 @@ def create_app():
         return response
         
     # Define upload handler function
+    @app.route('/upload', methods=['POST'])
     @app.route('/upload-torrent', methods=['POST', 'OPTIONS'])
     @app.route('/api/torrents', methods=['POST'])
     def handle_upload():
@@ -545,198 +876,184 @@ def create_app():
         if request.method == 'OPTIONS':
             return jsonify({'status': 'ok'})
             
+        # Check for both 'file' and 'torrent' field names for compatibility
+        if 'file' in request.files:
+            file = request.files['file']
+        elif 'torrent' in request.files:
+            file = request.files['torrent']
+        else:
+            error_msg = "No file part in the request. Expected 'file' or 'torrent' field."
+            logger.warning("Upload rejected: %s", error_msg)
+            return jsonify({
+                "success": False,
+                "error": "No file part",
+                "message": error_msg
+            }), 400
+        trace("Processing upload: %s", file.filename)
+        
+        if file.filename == '':
+            error_msg = "No file was selected"
+            logger.warning("Upload rejected: %s", error_msg)
+            return jsonify({
+                "success": False,
+                "error": "No selected file",
+                "message": error_msg
+            }), 400
+
+        if not is_torrent_filename(file.filename):
+            error_msg = f"Invalid file type: {file.filename}"
+            logger.warning("Upload rejected: %s", error_msg)
+            return jsonify({
+                "success": False,
+                "error": "Invalid file type",
+                "message": "File must be a .torrent file"
+            }), 400
+
+        upload_dir = app.config['UPLOAD_FOLDER']
+
+        filepath = None
         try:
-            print("\n=== New Upload Request ===")
-            print(f"Files received: {request.files}")
+            # Generate a safe filename (kept for display only)
+            from werkzeug.utils import secure_filename
+            filename = secure_filename(file.filename)
             
-            # Check for both 'file' and 'torrent' field names for compatibility
-            if 'file' in request.files:
-                file = request.files['file']
-                print("Using 'file' field for upload")
-            elif 'torrent' in request.files:
-                file = request.files['torrent']
-                print("Using 'torrent' field for upload")
-            else:
-                error_msg = "No file part in the request. Expected 'file' or 'torrent' field."
-                print(f"Error: {error_msg}")
-                return jsonify({
-                    "success": False,
-                    "error": "No file part",
-                    "message": error_msg
-                }), 400
-            print(f"Processing file: {file.filename}")
+            # Save to a temporary name first; the final name is
+            # content-addressed and only known once the info dict is hashed
+            filepath = os.path.join(upload_dir, f".{uuid.uuid4().hex}.part")
+            trace("Saving upload to: %s", filepath)
             
-            if file.filename == '':
-                error_msg = "No file was selected"
-                print(f"Error: {error_msg}")
-                return jsonify({
-                    "success": False,
-                    "error": "No selected file",
-                    "message": error_msg
-                }), 400
-
-            if not file.filename.lower().endswith('.torrent'):
-                error_msg = f"Invalid file type: {file.filename}"
-                print(f"Error: {error_msg}")
-                return jsonify({
-                    "success": False,
-                    "error": "Invalid file type",
-                    "message": "File must be a .torrent file"
-                }), 400
-
-            # Ensure upload directory exists
-            upload_dir = app.config['UPLOAD_FOLDER']
-            os.makedirs(upload_dir, exist_ok=True)
-            print(f"\n=== Upload Request ===")
-            print(f"Upload directory: {os.path.abspath(upload_dir)}")
-            print(f"Directory exists: {os.path.exists(upload_dir)}")
-            print(f"Directory is writable: {os.access(upload_dir, os.W_OK)}")
-            print(f"Files in directory before upload: {os.listdir(upload_dir) if os.path.exists(upload_dir) else 'Directory does not exist'}")
-
             try:
-                # Read the file data
-                file_data = file.read()
-                if not file_data:
-                    raise ValueError("File is empty")
-                print(f"Read {len(file_data)} bytes from file")
-                
-                # Generate a safe filename
-                from werkzeug.utils import secure_filename
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(upload_dir, filename)
-                
-                # Check if file already exists to avoid overwriting
-                if os.path.exists(filepath):
-                    base, ext = os.path.splitext(filename)
-                    counter = 1
-                    while os.path.exists(filepath):
-                        filename = f"{base}_{counter}{ext}"
-                        filepath = os.path.join(upload_dir, filename)
-                        counter += 1
-                
-                # Save the file first
-                print(f"\n=== Saving File ===")
-                print(f"Saving to: {filepath}")
-                print(f"File already exists: {os.path.exists(filepath)}")
-                
-                try:
-                    with open(filepath, 'wb') as f:
-                        f.write(file_data)
-                    
-                    # Verify file was written
-                    if not os.path.exists(filepath):
-                        raise IOError("File was not created after write operation")
-                        
-                    file_size = os.path.getsize(filepath)
-                    print(f"File saved successfully. Size: {file_size} bytes")
-                    print(f"File exists after write: {os.path.exists(filepath)}")
-                    print(f"File size on disk: {os.path.getsize(filepath)} bytes")
-                    print(f"Files in directory after save: {os.listdir(upload_dir)}")
-                    
-                except Exception as e:
-                    print(f"Error saving file: {str(e)}")
-                    print(f"Current working directory: {os.getcwd()}")
-                    print(f"Directory contents: {os.listdir(os.path.dirname(filepath) if os.path.dirname(filepath) else '.')}")
-                    raise
-                
-                # Compute info_hash from the torrent file
-                info_hash = compute_torrent_info_hash(file_data)
-                print(f"Computed info_hash: {info_hash}")
-                
-                # Create metadata
-                torrent_metadata = {
-                    'filename': filename,
-                    'filepath': filepath,
-                    'info_hash': info_hash,
-                    'size': file_size,
-                    'uploaded_at': datetime.datetime.utcnow().isoformat(),
-                    'peers': []
-                }
-                
-                # Add to our in-memory storage
-                if 'torrents' not in app.config:
-                    app.config['torrents'] = {}
-                app.config['torrents'][info_hash] = torrent_metadata
-                
-                # Prepare response
-                response_data = {
-                    "success": True,
-                    "message": "Torrent uploaded successfully",
-                    "filename": filename,
-                    "file_path": filepath,
-                    "info_hash": info_hash,
-                    "size": file_size,
-                    "status": "success"
-                }
-                
-                print("\n=== Upload Response ===")
-                print(f"Response data: {response_data}")
-                print(f"File exists in response handler: {os.path.exists(filepath)}")
-                print(f"File size in response handler: {os.path.getsize(filepath) if os.path.exists(filepath) else 0} bytes")
-                
-                print(f"Upload successful. Response: {response_data}")
+                # Stream the upload to disk, hashing the info dict on the way
+                hasher = IncrementalInfoHasher()
+                file_size = 0
+                for chunk in write_stream(file.stream, filepath, request.content_length or 0):
+                    file_size += len(chunk)
+                    if hasher is not None:
+                        try:
+                            hasher.feed(chunk)
+                        except BencodeDecodeError:
+                            hasher = None
                 
-                # Emit torrent_added event to all connected clients
-                socketio.emit('torrent_added', {
-                    'filename': filename,
-                    'info_hash': info_hash,
-                    'size': file_size,
-                    'uploaded_at': datetime.datetime.utcnow().isoformat()
-                })
-                
-                return jsonify(response_data)
+                if not file_size:
+                    raise ValueError("File is empty")
+                trace("File saved successfully. Size: %d bytes", file_size)
                 
             except Exception as e:
-                error_msg = f"Error processing file: {str(e)}"
-                print(f"Error: {error_msg}")
-                if os.path.exists(filepath):
-                    try:
-                        os.remove(filepath)
-                        print(f"Removed partially uploaded file: {filepath}")
-                    except Exception as cleanup_error:
-                        print(f"Error cleaning up file: {cleanup_error}")
-                
-                return jsonify({
-                    "success": False,
-                    "error": "File processing error",
-                    "message": error_msg
-                }), 500
-                
+                trace("Error saving file %s (cwd: %s): %s", filepath, os.getcwd(), e)
+                raise
+            
+            info_hash = hasher.hexdigest() if hasher is not None else None
+            if info_hash is None:
+                # Not a well-formed torrent; fall back to the slow path
+                with open(filepath, 'rb') as f:
+                    info_hash = compute_torrent_info_hash(f.read())
+            trace("Computed info_hash: %s", info_hash)
+            
+            # One file per info_hash, so re-uploads need a single stat
+            stored_path = os.path.join(upload_dir, f"{info_hash}.torrent")
+            if os.path.exists(stored_path):
+                # Already stored; keep the existing file and its display name
+                os.remove(filepath)
+                filepath = None
+                existing = app.config['torrents'].get(info_hash)
+                if existing is not None:
+                    filename = existing['filename']
+                trace("Torrent %s already stored, skipping save", info_hash)
+            else:
+                os.replace(filepath, stored_path)
+                filepath = stored_path
+                # Seed the scan's hash cache so the next scan skips this file
+                st = os.stat(stored_path)
+                info_hash_cache[(os.path.abspath(stored_path), st.st_size, st.st_mtime_ns)] = info_hash
+            
+            # Create metadata
+            torrent_metadata = {
+                'filename': filename,
+                'filepath': stored_path,
+                'info_hash': info_hash,
+                'size': file_size,
+                'uploaded_at': datetime.utcnow().isoformat(),
+                'peers': []
+            }
+            
+            # Add to our in-memory storage
+            app.config['torrents'][info_hash] = torrent_metadata
+            
+            # Prepare response
+            response_data = {
+                "success": True,
+                "message": "Torrent uploaded successfully",
+                "filename": filename,
+                "file_path": stored_path,
+                "info_hash": info_hash,
+                "size": file_size,
+                "status": "success"
+            }
+            
+            logger.info("Uploaded %s (%s, %d bytes)", filename, info_hash, file_size)
+            
+            # Emit torrent_added event to all connected clients
+            socketio.emit('torrent_added', {
+                'filename': filename,
+                'info_hash': info_hash,
+                'size': file_size,
+                'uploaded_at': torrent_metadata['uploaded_at']
+            })
+            schedule_torrents_refresh()
+            
+            return jsonify(response_data)
+            
         except Exception as e:
-            error_msg = f"Unexpected error: {str(e)}"
-            print(f"Unexpected error: {error_msg}")
+            error_msg = f"Error processing file: {str(e)}"
+            dump_trace()
+            logger.error("Upload failed: %s", error_msg)
+            if filepath:
+                try:
+                    os.remove(filepath)
+                    logger.info("Removed partially uploaded file: %s", filepath)
+                except FileNotFoundError:
+                    pass
+                except Exception as cleanup_error:
+                    logger.error("Error cleaning up file: %s", cleanup_error)
+            
             return jsonify({
                 "success": False,
-                "error": "Upload failed",
+                "error": "File processing error",
                 "message": error_msg
             }), 500
             
-        except Exception as e:
-            print(f"Error in upload_torrent: {str(e)}")
-            # Emit WebSocket error event
-            socketio.emit('torrent_upload_error', {
-                'error': str(e),
-                'timestamp': datetime.datetime.utcnow().isoformat()
-            }, namespace='/')
-            return jsonify({
-                "success": False,
-                "error": "Upload failed",
-                "message": str(e)
-            }), 500
+
+    @app.route('/api/torrents/<info_hash>/file', methods=['GET'])
+    def download_torrent_file(info_hash):
+        """Serve a stored .torrent file by its info_hash."""
+        torrent = app.config.get('torrents', {}).get(info_hash)
+        if not torrent:
+            return jsonify({"error": "Torrent not found"}), 404
+        
+        # Sent with sendfile/X-Sendfile where available, with conditional GETs
+        return send_from_directory(
+            app.config['UPLOAD_FOLDER'],
+            os.path.basename(torrent['filepath']),
+            mimetype='application/x-bittorrent',
+            download_name=torrent['filename'],
+            as_attachment=True,
+            conditional=True
+        )
 
     @app.route('/api/peers', methods=['GET'])
     def get_peers():
         """Get list of connected peers from the tracker."""
         try:
             # This endpoint will be called by the frontend to get the list of peers
-            if peer_manager and hasattr(peer_manager, 'peers'):
-                peers = [f"{ip}:{port}" for ip, port in peer_manager.peers.keys()]
+            session = get_session(request.args.get('info_hash'))
+            if session:
+                peers = session['peer_manager'].peer_labels
                 
                 # Emit WebSocket event for peer list update
                 socketio.emit('peers', {
                     'peers': peers,
                     'count': len(peers),
-                    'timestamp': datetime.utcnow().isoformat()
+                    'timestamp': now_iso()
                 })
                 
                 return jsonify({
@@ -763,174 +1080,278 @@ def create_app():
                 "tracker": TRACKER_URL
             }), 500
 
+    def error_response(message, code=500):
+        """Broadcast an error to all clients and build the matching JSON error response."""
+        socketio.emit('server_message', {'type': 'error', 'message': message})
+        return jsonify({"error": message}), code
+
     @app.route('/api/peers/connect', methods=['POST'])
-    async def connect_peers():
+    def connect_peers():
         """Connect to peers through the tracker."""
-        global peer_manager, current_torrent
+        nonlocal current_hash
 
-        try:
-            data = request.get_json()
-            if not data:
-                return jsonify({"error": "No data provided"}), 400
+        # Parsed by OrjsonProvider.loads; None (not an error page) if malformed
+        body = request.get_json(silent=True)
+        if not body:
+            return jsonify({"error": "No data provided"}), 400
 
-            torrent_path = data.get('torrent_path')
-            if not torrent_path:
-                return jsonify({"error": "No torrent path provided"}), 400
+        torrent_path = body.get('torrent_path')
+        if not torrent_path:
+            return jsonify({"error": "No torrent path provided"}), 400
 
-            if not os.path.exists(torrent_path):
-                return jsonify({"error": f"Torrent file not found: {torrent_path}"}), 404
+        try:
+            st = os.stat(torrent_path)
+        except OSError:
+            return jsonify({"error": f"Torrent file not found: {torrent_path}"}), 404
 
-            try:
-                # Load torrent file
-                current_torrent = Torrent(torrent_path)
+        try:
+            # Load torrent file (bencode parse + info-hash SHA1) unless unchanged
+            key = (os.path.abspath(torrent_path), st.st_size, st.st_mtime_ns)
+            torrent = torrent_cache.get(key)
+            if torrent is None:
+                torrent = torrent_cache[key] = Torrent(torrent_path)
+
+            # Reuse the torrent's session, or create one whose peer manager
+            # handshakes with the tracker session's peer ID
+            with sessions_lock:
+                # A torrent file replaced in place gets a new info hash; the
+                # session for its old contents would otherwise never close
+                stale = [h for h, other in sessions.items()
+                         if h != torrent.info_hash and
+                         other['torrent'].torrent_path == torrent.torrent_path]
+                stale = [sessions.pop(h) for h in stale]
+                session = sessions.get(torrent.info_hash)
+                if session is None:
+                    tracker = Tracker(torrent)
+                    peer_manager = run_on_peer_loop(new_peer_manager(
+                        torrent.info_hash, tracker.peer_id, torrent.info.num_pieces,
+                        max_connections=MAX_PEERS, connect_timeout=PEER_CONNECT_TIMEOUT))
+                    # Pick up pieces verified before a restart
+                    peer_manager.load_resume_bitfield(os.path.join(
+                        TORRENT_FOLDER, f"{torrent.info_hash_hex}.bitfield"))
+                    session = sessions[torrent.info_hash] = {
+                        'torrent': torrent,
+                        'tracker': tracker,
+                        'peer_manager': peer_manager,
+                        'piece_writer': PieceWriter(torrent.info, DOWNLOAD_FOLDER),
+                    }
+            for old_session in stale:
+                close_session(old_session)
+            current_hash = torrent.info_hash
+            tracker = session['tracker']
+            peer_manager = session['peer_manager']
+
+            def connect_to(addresses):
+                """Connect to (ip, port) pairs concurrently; return those that answered."""
+                # Don't connect to self
+                addresses = [(ip, port) for ip, port in addresses
+                             if ip != HOST or port != PORT]
+                connected = []
+                # Bounded by MAX_PEERS in the manager
+                results = run_on_peer_loop(peer_manager.add_peers(addresses))
+                for (ip, port), peer_conn in zip(addresses, results):
+                    if isinstance(peer_conn, Exception):
+                        logger.warning("Failed to connect to peer %s:%s: %s", ip, port, peer_conn)
+                    elif peer_conn:
+                        connected.append((ip, port))
+                return connected
+
+            # Fast resume: try the peers from the last connect before the tracker
+            peers_path = os.path.join(TORRENT_FOLDER, f"{torrent.info_hash_hex}.peers.json")
+            cached = found = load_peer_cache(peers_path, PEER_CACHE_TTL)
+            connected = connect_to(cached) if cached else []
+            if len(connected) < PEER_CACHE_MIN_PEERS:
+                # Announcing 'started' returns the current peer list
+                announced = [(peer.ip, peer.port) for peer in tracker.announce('started')]
+                found = list(dict.fromkeys(cached + announced))
+                connected = list(dict.fromkeys(connected + connect_to(announced)))
+                # Only an announce rewrites the cache, so its age counts from
+                # the last announce; new connections join the cached peers
+                refreshed = list(dict.fromkeys(connected + cached))
+                if refreshed:
+                    socketio.start_background_task(save_peer_cache, peers_path, refreshed)
+            connected_peers = [f"{ip}:{port}" for ip, port in connected]
+
+            # Emit WebSocket events
+            socketio.emit('server_message', {
+                'type': 'success',
+                'message': f'Connected to {len(connected_peers)} peers'
+            })
+            
+            socketio.emit('peers', {
+                'peers': connected_peers,
+                'count': len(connected_peers),
+                'total_found': len(found)
+            })
 
-                # After loading torrent, register with tracker as download client
-                socketio.emit('register_peer', {
-                    'peer_id': f"DOWNLOAD_PEER_{hash(current_torrent.info_hash) % 10000:04d}",
-                    'port': PORT,
-                    'client_type': 'download_client',
-                    'torrent_hash': current_torrent.info_hash.hex() if hasattr(current_torrent.info_hash, 'hex') else str(current_torrent.info_hash),
-                    'torrent_name': os.path.basename(torrent_path),
-                    'ip_address': HOST
-                })
+            # Register as download client and active downloader in one event
+            socketio.emit('register_peer', {
+                'peer_id': f"ACTIVE_PEER_{torrent.peer_tag}",
+                'port': PORT,
+                'client_type': 'active_downloader',
+                'states': ['download_client', 'active_downloader'],
+                'torrent_hash': torrent.info_hash_hex,
+                'torrent_name': os.path.basename(torrent_path),
+                'connected_peers': len(connected_peers),
+                'ip_address': HOST
+            })
 
-                # Create tracker and get peers
-                tracker = Tracker(current_torrent)
-                peers = await tracker.get_peers()  # Make sure this is async
-
-                # Create peer manager
-                peer_id = b"-HOST01-" + os.urandom(12)  # Unique ID for host
-                peer_manager = PeerManager(current_torrent.info_hash, peer_id)
-
-                # Connect to peers
-                connected_peers = []
-                for peer in peers:
-                    try:
-                        if peer.ip != HOST or peer.port != PORT:  # Don't connect to self
-                            peer_conn = await peer_manager.add_peer(peer.ip, peer.port)
-                            if peer_conn:
-                                connected_peers.append(f"{peer.ip}:{peer.port}")
-                    except Exception as peer_error:
-                        print(f"Failed to connect to peer {peer.ip}:{peer.port}: {peer_error}")
-
-                # Notify tracker about this peer
-                try:
-                    await tracker.announce(peer_id, PORT, event='started')
-                except Exception as e:
-                    print(f"Warning: Could not announce to tracker: {e}")
+            return jsonify({
+                "status": "success",
+                "connected_peers": connected_peers,
+                "total_peers_found": len(found),
+                "tracker": TRACKER_URL
+            })
+        except Exception as e:
+            return error_response(f'Error processing torrent: {e}')
 
-                # Emit WebSocket events
-                socketio.emit('server_message', {
-                    'type': 'success',
-                    'message': f'Connected to {len(connected_peers)} peers'
-                })
-                
-                socketio.emit('peers', {
-                    'peers': connected_peers,
-                    'count': len(connected_peers),
-                    'total_found': len(peers)
-                })
+    def download_batch(session, piece_indices):
+        """
+        Download, verify and store a batch of pieces for one torrent.
+        
+        Args:
+            session: The torrent's entry in sessions
+            piece_indices: Pieces to download (no duplicates)
+            
+        Returns:
+            (payload, status code) for the JSON response; errors have also
+            been broadcast as a server_message
+        """
+        torrent = session['torrent']
+        peer_manager = session['peer_manager']
+        piece_writer = session['piece_writer']
+        info = torrent.info
+        results = run_on_peer_loop(peer_manager.download_pieces(
+            {i: info.piece_size(i) for i in piece_indices}))
+
+        downloaded = []
+        failed = []
+        data_size = 0
+        verified = info.verify_pieces({i: piece for i, piece in results.items() if piece})
+        for piece_index in piece_indices:
+            # Pop so each piece buffer is released once it is on disk
+            piece = results.pop(piece_index)
+            if piece and not verified[piece_index]:
+                logger.warning("Piece %d failed hash check", piece_index)
+                piece = None
+            if piece:
+                # Store before recording it, so the resume bitfield never
+                # claims a piece that isn't on disk
+                piece_writer.write_piece(piece_index, piece)
+                peer_manager.mark_have(piece_index)
+                downloaded.append(piece_index)
+                data_size += len(piece)
+            else:
+                failed.append(piece_index)
 
-                # Register as active download peer
-                socketio.emit('register_peer', {
-                    'peer_id': f"ACTIVE_PEER_{hash(current_torrent.info_hash) % 10000:04d}",
-                    'port': PORT,
-                    'client_type': 'active_downloader',
-                    'torrent_hash': current_torrent.info_hash.hex() if hasattr(current_torrent.info_hash, 'hex') else str(current_torrent.info_hash),
-                    'connected_peers': len(connected_peers),
-                    'ip_address': HOST
-                })
+        if not downloaded:
+            pieces = ", ".join(map(str, piece_indices))
+            if all(peer_manager.availability(i) == 0 for i in piece_indices):
+                message, code = f'No peer has piece {pieces}', 404
+            else:
+                message, code = f'Failed to download piece {pieces}', 500
+            socketio.emit('server_message', {'type': 'error', 'message': message})
+            return {"error": message}, code
 
-                return jsonify({
-                    "status": "success",
-                    "connected_peers": connected_peers,
-                    "total_peers_found": len(peers),
-                    "tracker": TRACKER_URL
-                })
+        socketio.emit('server_message', {
+            'type': 'success',
+            'message': f'Successfully downloaded {len(downloaded)} piece(s) ({data_size} bytes)'
+        })
 
-            except Exception as e:
-                socketio.emit('server_message', {
-                    'type': 'error',
-                    'message': f'Error processing torrent: {str(e)}'
-                })
-                return jsonify({"error": f"Error processing torrent: {str(e)}"}), 500
+        # Update tracker about download progress
+        queue_download_progress(torrent.info_hash_hex, {
+            'peer_id': f"DOWNLOAD_PEER_{torrent.peer_tag}",
+            'port': PORT,
+            'client_type': 'downloading',
+            'torrent_hash': torrent.info_hash_hex,
+            'downloaded_pieces': max(downloaded) + 1,
+            'ip_address': HOST
+        })
 
+        return {
+            "status": "success",
+            "piece": downloaded[0],
+            "pieces": downloaded,
+            "failed": failed,
+            "data_size": data_size
+        }, 200
+
+    def download_in_background(session, piece_indices):
+        """Run download_batch and report the outcome as a download_complete event."""
+        try:
+            payload, code = download_batch(session, piece_indices)
         except Exception as e:
-            socketio.emit('server_message', {
-                'type': 'error',
-                'message': f'Server error: {str(e)}'
-            })
-            return jsonify({"error": f"Server error: {str(e)}"}), 500
+            logger.exception("Background download failed")
+            payload, code = {"error": f"Download error: {e}"}, 500
+            socketio.emit('server_message', {'type': 'error', 'message': payload['error']})
+        socketio.emit('download_complete', dict(
+            payload,
+            torrent_hash=session['torrent'].info_hash_hex,
+            requested=piece_indices,
+            code=code
+        ))
 
     @app.route('/api/download/start', methods=['POST'])
-    async def start_download():
-        """Start downloading a piece from peers."""
+    def start_download():
+        """Download one or more pieces, spread across the connected peers."""
         try:
-            data = request.get_json()
-            piece_index = data.get('piece_index', 0)
+            body = request.get_json(silent=True) or {}
+            if not isinstance(body, dict):
+                return jsonify({"error": "Expected a JSON object"}), 400
 
-            if not peer_manager:
+            session = get_session(body.get('info_hash'))
+            if not session:
                 return jsonify({"error": "No peers connected"}), 400
+            num_pieces = session['torrent'].info.num_pieces
+
+            def is_piece_index(value):
+                # bool is an int subclass, but true/false are not indices
+                return (isinstance(value, int) and not isinstance(value, bool)
+                        and 0 <= value < num_pieces)
+
+            # Accept a batch ({"piece_indices": [...]}), a number of pieces to
+            # pick rarest-first ({"count": N}) or a single piece_index. Bad
+            # input is the caller's problem, so it gets a 400 and no broadcast.
+            piece_indices = body.get('piece_indices')
+            if piece_indices is not None:
+                if not (isinstance(piece_indices, list) and
+                        all(is_piece_index(i) for i in piece_indices)):
+                    return jsonify({"error": f"piece_indices must be a list of "
+                                             f"integers in [0, {num_pieces})"}), 400
+            elif 'count' in body:
+                count = body['count']
+                if not (isinstance(count, int) and not isinstance(count, bool)
+                        and 0 < count <= num_pieces):
+                    return jsonify({"error": f"count must be an integer in "
+                                             f"[1, {num_pieces}]"}), 400
+                piece_indices = run_on_peer_loop(
+                    session['peer_manager'].rarest_pieces(count))
+            else:
+                piece_indices = [body.get('piece_index', 0)]
+                if not is_piece_index(piece_indices[0]):
+                    return jsonify({"error": f"piece_index must be an integer in "
+                                             f"[0, {num_pieces})"}), 400
+            piece_indices = list(dict.fromkeys(piece_indices))
+            if not piece_indices:
+                return jsonify({"error": "No pieces requested"}), 400
 
             # Emit download started event
             socketio.emit('download_started', {
-                'piece_index': piece_index,
-                'timestamp': datetime.utcnow().isoformat()
+                'piece_index': piece_indices[0],
+                'piece_indices': piece_indices,
+                'timestamp': now_iso()
             })
 
-            # Get a peer that has the piece
-            peer = await peer_manager.get_peer_for_piece(piece_index)
-            if not peer:
-                socketio.emit('server_message', {
-                    'type': 'error',
-                    'message': f'No peer has piece {piece_index}'
-                })
-                return jsonify({"error": "No peer has the requested piece"}), 404
-
-            # Request the first block of the piece
-            block = BlockRequest(piece_index=piece_index, offset=0)
-            data = await peer.request_piece(piece_index, block)
+            if body.get('wait') is False:
+                # Return at once; the result arrives as a download_complete event
+                socketio.start_background_task(download_in_background, session, piece_indices)
+                return jsonify({"status": "queued", "pieces": piece_indices}), 202
 
-            if data:
-                socketio.emit('server_message', {
-                    'type': 'success',
-                    'message': f'Successfully downloaded piece {piece_index} ({len(data)} bytes)'
-                })
-                
-                # Update tracker about download progress
-                if current_torrent:
-                    socketio.emit('register_peer', {
-                        'peer_id': f"DOWNLOAD_PEER_{hash(current_torrent.info_hash) % 10000:04d}",
-                        'port': PORT,
-                        'client_type': 'downloading',
-                        'torrent_hash': current_torrent.info_hash.hex() if hasattr(current_torrent.info_hash, 'hex') else str(current_torrent.info_hash),
-                        'downloaded_pieces': piece_index + 1,
-                        'ip_address': HOST
-                    })
-                
-                return jsonify({
-                    "status": "success",
-                    "piece": piece_index,
-                    "data_size": len(data)
-                })
-            else:
-                socketio.emit('server_message', {
-                    'type': 'error',
-                    'message': f'Failed to download piece {piece_index}'
-                })
-                return jsonify({"error": "Failed to download piece"}), 500
+            payload, code = download_batch(session, piece_indices)
+            return jsonify(payload), code
 
         except Exception as e:
-            socketio.emit('server_message', {
-                'type': 'error',
-                'message': f'Download error: {str(e)}'
-            })
-            return jsonify({"error": str(e)}), 500
-
-    @app.route('/static/<path:path>')
-    def serve_static(path):
-        """Serve static files."""
-        return send_from_directory('web/static', path)
+            return error_response(f'Download error: {e}')
 
     @app.errorhandler(404)
     def not_found_error(error):
@@ -942,284 +1363,85 @@ def create_app():
 
     return app, socketio
 
-def create_basic_index():
-    """Create a basic index.html if it doesn't exist."""
-    index_path = os.path.join('web', 'templates', 'index.html')
-    if not os.path.exists(index_path):
-        os.makedirs(os.path.dirname(index_path), exist_ok=True)
-        with open(index_path, 'w', encoding='utf-8') as f:
-            f.write('''<!DOCTYPE html>
-<html>
-<head>
-    <title>P2P Torrent Client (Host)</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    <style>
-        .progress { height: 25px; }
-        .progress-bar { transition: width 0.3s; }
-        .peer-list { max-height: 300px; overflow-y: auto; }
-    </style>
-</head>
-<body>
-    <div class="container mt-4">
-        <h1 class="mb-4">P2P Torrent Client (Host)</h1>
+# Long-lived event loop that owns every peer connection. Flask would run
+# each async view on a fresh loop, leaving the streams opened by one request
+# bound to a loop that is gone by the next. It runs on a real OS thread and
+# request threads block on it, so serve the app with threaded workers
+# (gunicorn -k gthread), not eventlet/gevent green threads.
+_peer_loop = None
+_peer_loop_lock = threading.Lock()
+
+def peer_loop():
+    """Return the peer I/O event loop, starting its thread on first use."""
+    global _peer_loop
+    with _peer_loop_lock:
+        if _peer_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='peer-loop',
+                             daemon=True).start()
+            _peer_loop = loop
+    return _peer_loop
+
+def run_on_peer_loop(coro, timeout=PEER_LOOP_TIMEOUT):
+    """
+    Run a coroutine on the peer loop and wait for its result.
+    
+    Args:
+        coro: Coroutine to run; it may await peer connections from earlier calls
+        timeout: Seconds to wait before cancelling the coroutine
         
-        <div class="row">
-            <div class="col-md-6">
-                <div class="card mb-4">
-                    <div class="card-header">
-                        <h5>Upload Torrent</h5>
-                    </div>
-                    <div class="card-body">
-                        <div class="mb-3">
-                            <input type="file" id="torrent-file" class="form-control" accept=".torrent">
-                        </div>
-                        <button id="upload-btn" class="btn btn-primary">Upload & Start</button>
-                        <div id="upload-status" class="mt-2"></div>
-                    </div>
-                </div>
-
-                <div class="card mb-4">
-                    <div class="card-header d-flex justify-content-between align-items-center">
-                        <h5>Download Progress</h5>
-                        <span id="download-speed" class="badge bg-info">0 KB/s</span>
-                    </div>
-                    <div class="card-body">
-                        <div class="progress mb-2">
-                            <div id="progress-bar" class="progress-bar" role="progressbar" style="width: 0%">0%</div>
-                        </div>
-                        <div id="progress-text" class="text-muted small">No active downloads</div>
-                    </div>
-                </div>
-            </div>
-
-            <div class="col-md-6">
-                <div class="card">
-                    <div class="card-header d-flex justify-content-between align-items-center">
-                        <h5>Connected Peers</h5>
-                        <button id="refresh-peers" class="btn btn-sm btn-outline-secondary">⟳ Refresh</button>
-                    </div>
-                    <div class="card-body p-0">
-                        <div id="peers-list" class="list-group list-group-flush peer-list">
-                            <div class="list-group-item text-muted">Not connected to any peers</div>
-                        </div>
-                    </div>
-                    <div class="card-footer text-muted small">
-                        Tracker: <span id="tracker-url">{{ tracker_url }}</span>
-                    </div>
-                </div>
-            </div>
-        </div>
-
-        <div class="card mt-4">
-            <div class="card-header">
-                <h5>Logs</h5>
-            </div>
-            <div class="card-body p-0">
-                <pre id="logs" class="p-3 mb-0 bg-dark text-light" style="min-height: 100px; max-height: 200px; overflow-y: auto;"></pre>
-            </div>
-        </div>
-    </div>
-
-    <script src="https://cdn.socket.io/4.5.4/socket.io.min.js"></script>
-    <script>
-        // Configuration
-        const config = {
-            trackerUrl: document.getElementById('tracker-url').textContent,
-            socketUrl: window.location.origin
-        };
-
-        // DOM Elements
-        const elements = {
-            uploadBtn: document.getElementById('upload-btn'),
-            torrentFile: document.getElementById('torrent-file'),
-            uploadStatus: document.getElementById('upload-status'),
-            peersList: document.getElementById('peers-list'),
-            progressBar: document.getElementById('progress-bar'),
-            progressText: document.getElementById('progress-text'),
-            downloadSpeed: document.getElementById('download-speed'),
-            refreshPeers: document.getElementById('refresh-peers'),
-            logs: document.getElementById('logs')
-        };
-
-        // Initialize Socket.IO - Connect to TRACKER
-        const socket = io(config.trackerUrl, {
-            reconnection: true,
-            reconnectionAttempts: config.reconnectAttempts,
-            reconnectionDelay: config.reconnectDelay
-        });
-
-        // Socket Events
-        socket.on('connect', () => {
-            log('Connected to Tracker server');
-        });
-
-        socket.on('disconnect', () => {
-            log('Disconnected from Tracker server');
-        });
-
-        socket.on('server_message', (data) => {
-            log(`[${data.type}] ${data.message}`);
-        });
-
-        socket.on('status', (data) => {
-            log(`Status: ${data.message}`);
-        });
-
-        socket.on('peers', (data) => {
-            updatePeerList(data.peers || []);
-            log(`Peer list updated: ${data.count} peers connected`);
-        });
-
-        socket.on('download_started', (data) => {
-            log(`Download started for piece ${data.piece_index}`);
-        });
-
-        // UI Event Handlers
-        elements.uploadBtn.addEventListener('click', handleUpload);
-        elements.refreshPeers.addEventListener('click', fetchPeers);
-
-        // Functions
-        function log(message) {
-            const logEntry = document.createElement('div');
-            logEntry.textContent = `[${new Date().toLocaleTimeString()}] ${message}`;
-            elements.logs.appendChild(logEntry);
-            elements.logs.scrollTop = elements.logs.scrollHeight;
-        }
-
-        async function handleUpload() {
-            const file = elements.torrentFile.files[0];
-            if (!file) {
-                alert('Please select a .torrent file first');
-                return;
-            }
-
-            const formData = new FormData();
-            formData.append('file', file);
-
-            try {
-                elements.uploadBtn.disabled = true;
-                elements.uploadStatus.textContent = 'Uploading torrent file...';
-                
-                const response = await fetch(config.uploadEndpoint, {
-                    method: 'POST',
-                    body: formData
-                });
-
-                const result = await response.json();
-                
-                if (response.ok) {
-                    log(`Successfully uploaded: ${result.filename}`);
-                    await connectToPeers(result.file_path);
-                } else {
-                    throw new Error(result.error || 'Failed to upload torrent');
-                }
-            } catch (error) {
-                log(`Error: ${error.message}`);
-                elements.uploadStatus.textContent = `Error: ${error.message}`;
-            } finally {
-                elements.uploadBtn.disabled = false;
-            }
-        }
-
-        async function connectToPeers(torrentPath) {
-            try {
-                log('Connecting to peers...');
-                const response = await fetch('/api/peers/connect', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({
-                        torrent_path: torrentPath
-                    })
-                });
-
-                const result = await response.json();
-                
-                if (response.ok) {
-                    log(`Connected to ${result.connected_peers.length} out of ${result.total_peers_found} peers`);
-                    updatePeerList(result.connected_peers);
-                } else {
-                    throw new Error(result.error || 'Failed to connect to peers');
-                }
-            } catch (error) {
-                log(`Error connecting to peers: ${error.message}`);
-            }
-        }
-
-        async function fetchPeers() {
-            try {
-                // Try to get config from server
-                const response = await fetch(config.apiBase + '/config');
-                const data = await response.json();
-                
-                if (data.status === 'success') {
-                    updatePeerList(data.peers || []);
-                }
-            } catch (error) {
-                log(`Error fetching peers: ${error.message}`);
-            }
-        }
-
-        function updatePeerList(peers) {
-            if (peers.length === 0) {
-                elements.peersList.innerHTML = '<div class="list-group-item text-muted">No peers connected</div>';
-                return;
-            }
-
-            elements.peersList.innerHTML = peers
-                .map(peer => `
-                    <div class="list-group-item d-flex justify-content-between align-items-center">
-                        <span>${peer}</span>
-                        <span class="badge bg-success">Connected</span>
-                    </div>
-                `)
-                .join('');
-        }
-
-        // Initial setup
-        fetchPeers();
-        log('Client initialized. Ready to upload torrents.');
-    </script>
-</body>
-</html>''')
+    Returns:
+        The coroutine's result (its exception is re-raised here)
+        
+    Raises:
+        TimeoutError: If the coroutine did not finish in time
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, peer_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"Peer operation timed out after {timeout:g}s") from None
+
+async def new_peer_manager(*args, **kwargs):
+    """
+    Create a PeerManager on the peer loop.
+    
+    Its asyncio lock and semaphore look up the current event loop when
+    constructed on Python < 3.10, which fails on request threads.
+    """
+    return PeerManager(*args, **kwargs)
 
+@functools.lru_cache(maxsize=1)
 def get_local_ip():
-    """Get the local IP address of the machine."""
+    """Get the local IP address of the machine (resolved once per process)."""
     try:
         # Connect to an external server to get the local IP
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        local_ip = s.getsockname()[0]
-        s.close()
-        return local_ip
-    except Exception as e:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            # Don't stall startup on a broken network
+            s.settimeout(0.2)
+            s.connect(("8.8.8.8", 80))
+            return s.getsockname()[0]
+    except OSError:
         return "127.0.0.1"
 
 def run_app():
-    # Create necessary directories
-    os.makedirs('web/static/js', exist_ok=True)
-    os.makedirs('web/templates', exist_ok=True)
-    os.makedirs('uploads', exist_ok=True)
-    os.makedirs('torrents', exist_ok=True)
-
-    # Create basic index.html if it doesn't exist
-    create_basic_index()
-    
-    # Create and configure the app
+    # Create and configure the app (templates and assets are committed under web/)
     app = Flask(__name__,
               static_folder='web/static',
               template_folder='web/templates')
     
     # Basic configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-123')
-    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
     app.config['TRACKER_URL'] = TRACKER_URL
     app.config['TEMPLATES_AUTO_RELOAD'] = True
+    app.json = OrjsonProvider(app)
     
     # Initialize SocketIO
-    socketio = SocketIO(app, cors_allowed_origins="*")
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode=SOCKETIO_ASYNC_MODE,
+                        json=PacketJSON)
     
     # Register routes
     @app.route('/')
@@ -1273,43 +1495,32 @@ def add_routes(app):
     def upload():
         """Simple file upload endpoint for testing."""
         try:
-            print("\n=== Upload Request Received ===")
-            print(f"Files received: {request.files}")
+            logger.debug("Upload request, files received: %s", request.files)
             
             if 'file' not in request.files:
-                print("No file part in request")
+                logger.debug("No file part in request")
                 return jsonify({'error': 'No file part'}), 400
                 
             file = request.files['file']
             if file.filename == '':
-                print("No file selected")
+                logger.debug("No file selected")
                 return jsonify({'error': 'No selected file'}), 400
                 
-            if file and file.filename.endswith('.torrent'):
-                upload_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-                os.makedirs(upload_dir, exist_ok=True)
-                filename = os.path.join(upload_dir, file.filename)
-                print(f"Saving file to: {filename}")
-                file.save(filename)
+            if file and is_torrent_filename(file.filename):
+                filename = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
+                logger.debug("Saving file to: %s", filename)
+                # write_stream raises if the file can't be created or written
+                for _ in write_stream(file.stream, filename, request.content_length or 0):
+                    pass
                 
-                if not os.path.exists(filename):
-                    print(f"Error: File was not saved to {filename}")
-                    return jsonify({'error': 'Failed to save file'}), 500
-                    
-                print(f"File saved successfully: {os.path.getsize(filename)} bytes")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("File saved successfully: %d bytes", os.path.getsize(filename))
                 
-                # Trigger a torrent list refresh and emit to all clients
-                try:
-                    torrents_dir = os.path.dirname(filename)
-                    result = scan_torrents_directory(torrents_dir)
-                    if result['success']:
-                        print(f"Successfully refreshed torrent list with {len(result.get('torrents', []))} torrents")
-                        # Emit the updated list to all connected clients
-                        socketio.emit('torrents_list', result)
-                    else:
-                        print(f"Warning: Failed to refresh torrent list: {result.get('error', 'Unknown error')}")
-                except Exception as e:
-                    print(f"Error refreshing torrent list: {str(e)}")
+                # Refresh the torrent list for all clients in the background
+                # (only available when the app was built by create_app)
+                schedule_refresh = current_app.extensions.get('schedule_torrents_refresh')
+                if schedule_refresh is not None:
+                    schedule_refresh()
                 
                 return jsonify({
                     'success': True,
@@ -1318,13 +1529,12 @@ def add_routes(app):
                     'path': filename
                 })
             else:
-                print(f"Invalid file type: {file.filename}")
+                logger.debug("Invalid file type: %s", file.filename)
                 return jsonify({'error': 'Invalid file type'}), 400
                 
         except Exception as e:
-            import traceback
             error_trace = traceback.format_exc()
-            print(f"Error in upload handler: {error_trace}")
+            logger.exception("Error in upload handler")
             return jsonify({
                 'error': str(e),
                 'message': 'An error occurred during file upload',
@@ -1362,7 +1572,7 @@ if __name__ == '__main__':
         socketio.run(app, 
                     host=HOST, 
                     port=PORT, 
-                    debug=True, 
+                    debug=DEBUG, 
                     use_reloader=False,
                     allow_unsafe_werkzeug=True)
     except Exception as e:
@@ -78,6 +78,11 @@ document.addEventListener('DOMContentLoaded', () => {
         log(data.message, data.type || 'info');
     });
 
+    // Bursts of server messages arrive coalesced into one frame
+    socket.on('server_message_batch', (messages) => {
+        messages.forEach((data) => log(data.message, data.type || 'info'));
+    });
+
     // Handle progress updates
     socket.on('progress', (data) => {
         updateProgress(data.progress);
@@ -0,0 +1,19 @@
+"""
+WSGI entry point for running the Peer2Peer Torrent Client (Host Machine)
+under a production server instead of the Werkzeug development server.
+
+Example (Socket.IO keeps client state in memory, so use a single worker):
+    gunicorn -k gthread --threads 32 -w 1 --bind 0.0.0.0:5000 wsgi:app
+
+Use threaded workers rather than eventlet/gevent: peer I/O runs on its own
+OS thread (see main.run_on_peer_loop), and a request blocked waiting on it
+would stall a monkey-patched worker's whole hub.
+
+To use more cores, start one such process per core on its own port with
+SOCKETIO_MESSAGE_QUEUE pointing at a shared Redis, and put a load
+balancer with sticky sessions (e.g. nginx ip_hash) in front. Sticky
+sessions are needed because each process also owns its peer connections.
+"""
+from main import create_app
+
+app, socketio = create_app()